@@ -1,12 +1,14 @@
 import os
 import time
+import stripe
 from flask import (
     Flask,
     session,
     send_from_directory,
     redirect,
     url_for,
-    request
+    request,
+    flash,
 )
 from .services.gcs import GcsStore
 from .services.utils import user_id_for_email, canonicalize_email
@@ -35,6 +37,10 @@ def create_app():
     app.config["SYS_ADMIN_BUCKET"] = os.environ.get("SYS_ADMIN_BUCKET", "gmoney_sys_admin")
     app.config["TYPE_CONFIG_PATH"] = os.environ.get("TYPE_CONFIG_PATH", "type_config.json")
 
+    # every upload (leases, receipts, ledger CSVs); Cloud Run rejects HTTP/1
+    # request bodies over 32 MiB anyway. Oversized uploads get the 413 handler below.
+    app.config["MAX_CONTENT_LENGTH"] = int(os.getenv("MAX_UPLOAD_BYTES", 32 * 1024 * 1024))
+
     app.config["AUTH_DISABLED"] = os.getenv("AUTH_DISABLED", "").lower() in ("1", "true", "yes")
     app.config["DEV_EMAIL"] = os.getenv("DEV_EMAIL", "dev@gmoney.me")
 
@@ -51,6 +57,9 @@ def create_app():
                     "auth_at": int(time.time()),
                 })
 
+    # Stripe secret key, set once for the checkout route and the webhook
+    stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
+
     # shared store
     app.gcs = GcsStore(app.config["GCS_BUCKET"])
     app.config_store = GcsStore(app.config["SYS_ADMIN_BUCKET"])
@@ -78,6 +87,12 @@ def create_app():
     app.register_blueprint(rental_tenant_bp)
     app.register_blueprint(stripe_webhook_bp)
 
+    @app.errorhandler(413)
+    def _upload_too_large(_err):
+        limit_mib = app.config["MAX_CONTENT_LENGTH"] // (1024 * 1024)
+        flash(f"That file is too large to upload (limit {limit_mib} MiB).", "error")
+        return redirect(request.referrer or url_for("root"))
+
     @app.get("/")
     def root():
         return redirect(url_for("auth.login_form"))
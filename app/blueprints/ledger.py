@@ -1,6 +1,7 @@
 # app/blueprints/ledger.py
 from flask import Blueprint, current_app, render_template, request, redirect, url_for, abort, flash
 import datetime as dt
+import heapq
 from collections import defaultdict
 from typing import Dict, Tuple
 
@@ -11,6 +12,9 @@ from ..services.utils import (
     current_user_identity,
     now_iso,
     normalize_entry,
+    read_json_cached,
+    add_dedupe_key,
+    invalidate_dedupe_keys,
 )
 
 bp = Blueprint("ledger", __name__, url_prefix="/ledger")
@@ -81,8 +85,12 @@ def _within(ts_iso: str, start_dt: dt.datetime, end_dt: dt.datetime) -> bool:
     return (t >= start_dt) and (t < end_dt)
 
 
+def _ts_key(e: dict) -> str:
+    return e.get("ts", "")
+
+
 def _entries(store, user_id) -> list:
-    idx = store.read_json(f"{user_prefix(user_id)}ledger/index.json") or []
+    idx = read_json_cached(store, f"{user_prefix(user_id)}ledger/index.json") or []
     return idx
 
 
@@ -113,7 +121,7 @@ def _weekly_budget_by_category(store, user_id) -> Dict[str, float]:
     from ..logic.weekly_budget import build_weekly_budget
     pref = user_prefix(user_id)
 
-    snapshot = store.read_json(f"{pref}latest.json") or {}
+    snapshot = read_json_cached(store, f"{pref}latest.json") or {}
     # If your plan path differs, adjust here:
     plan     = store.read_json(f"{pref}plans/current.json") or {}
 
@@ -182,20 +190,17 @@ def list_entries():
     _, user_id = current_user_identity()
     pref = user_prefix(user_id)
     store = current_app.gcs
-    latest = store.read_json(f"{pref}latest.json") or {}
+    latest = read_json_cached(store, f"{pref}latest.json") or {}
 
     # list view table
     index = _entries(store, user_id)
-    print(index)
-    print(type(index))
-    index = sorted(index, key=lambda x: x.get("ts", ""), reverse=True)[:100]
+    index = heapq.nlargest(100, index, key=_ts_key)
 
     # legacy "period" still supported for your existing stats renderer
     period = (request.args.get("period") or "").lower().strip()
     if period not in {"week", "month", "year", "all"}:
         # ignore if you pass start/end; we won't use it for budget
         period = "month"
-    stats = compute_ledger_stats(store, user_id, period)
 
     # new date-range window + budget comparison
     start_dt, end_dt = _window_from_query()
@@ -299,6 +304,7 @@ def create_entry():
     idx.append(d_entry)
 
     store.write_json(idx_path, idx)
+    add_dedupe_key(store, pref, d_entry.get("ts"), d_entry.get("amount"))
 
     snap_ts = entry["id"].replace(":", "-")
     store.write_json(f"{user_prefix(user_id)}snapshots/{snap_ts}.json", updated)
@@ -340,6 +346,7 @@ def delete_entry(entry_id: str):
     # remove from index
     new_index = [e for e in index if e.get("id") != entry_id]
     store.write_json(idx_path, new_index)
+    invalidate_dedupe_keys(store, pref)
 
     # archive deleted entry (optional)
     store.write_json(f"{pref}ledger/deleted/{entry_id}.json", entry)
@@ -355,7 +362,7 @@ def history():
     pref = user_prefix(user_id)
 
     index = current_app.gcs.read_json(f"{pref}ledger/index.json") or []
-    index = sorted(index, key=lambda x: x.get("ts", ""), reverse=True)[:200]
+    index = heapq.nlargest(200, index, key=_ts_key)
 
     rows = []
     for t in index:
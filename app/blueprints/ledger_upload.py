@@ -3,8 +3,11 @@ import csv
 import io
 import re
 import hashlib
+import heapq
 import datetime as dt
-from typing import Tuple, Dict, Any, List
+from copy import deepcopy
+from functools import lru_cache
+from typing import Dict, List, Tuple
 from flask import Blueprint, request, redirect, url_for, flash, current_app, render_template
 from ..logic.ledger import apply_transaction
 from ..services.utils import (
@@ -12,67 +15,94 @@ from ..services.utils import (
     current_user_identity,
     now_iso,
     normalize_entry,
+    to_cents,
+    dedupe_key,
+    dedupe_path,
+    load_dedupe_keys,
 )
 
-COST_TYPES = {
+COST_TYPES = frozenset({
     "health_fitness", "grocery", "entertainment", "utility",
     "pet", "clothes", "other"
-}
+})
+ALLOWED_TYPES = frozenset({"expense", "income", "transfer", "debt_payment"})
 
 bp = Blueprint("ledger_upload", __name__)
 
+# parallel GCS writes per upload / save_review request
+_WRITE_WORKERS = 16
+
+# review form field names are "<prefix><entry id>"
+_EDIT_FIELD_PREFIXES = ("type-", "category-", "note-", "from-", "to-")
+
+# "to" select values that target a debt instead of an account
+_DEBT_PREFIX = "debt::"
+
 # --- helpers ---------------------------------------------------------------
 
 DATE_FMTS = ("%m/%d/%y", "%m/%d/%Y", "%Y-%m-%d")
 
+_CSV_READ_BUFFER = 1 << 20
+
+# newest inbox rows rendered on /ledger/review (adjust page size as you like)
+_REVIEW_PAGE_SIZE = 1000
+
+_WS_RE = re.compile(r"\s+")
+
 def _norm_desc(s: str) -> str:
     # remove repeated spaces, upper for stable matching, strip punctuation spam
-    s = (s or "").strip()
-    s = re.sub(r"\s+", " ", s)
-    return s.upper()
+    return _WS_RE.sub(" ", (s or "").strip()).upper()
 
+@lru_cache(maxsize=4096)
 def _parse_date_to_iso(date_str: str) -> str:
+    # memoized: bank exports repeat the same few hundred dates across
+    # thousands of rows, and each miss can cost several failed strptimes
     raw = (date_str or "").strip()
+    strptime = dt.datetime.strptime
     for fmt in DATE_FMTS:
         try:
-            d = dt.datetime.strptime(raw, fmt).date()
+            d = strptime(raw, fmt).date()
             # midnight UTC with Z suffix to match your ledger style
-            return dt.datetime(d.year, d.month, d.day, 0, 0, 0, tzinfo=dt.timezone.utc).isoformat().replace("+00:00", "Z")
+            return f"{d.isoformat()}T00:00:00Z"
         except Exception:
             continue
     # last resort: try dt.fromisoformat
     try:
         d = dt.date.fromisoformat(raw[:10])
-        return dt.datetime(d.year, d.month, d.day, 0, 0, 0, tzinfo=dt.timezone.utc).isoformat().replace("+00:00", "Z")
+        return f"{d.isoformat()}T00:00:00Z"
     except Exception:
         raise ValueError(f"Bad date: {date_str!r}")
 
-def _to_float(x) -> float:
-    try:
-        return float(str(x).replace(",", "").strip())
-    except Exception:
-        return 0.0
+# canonical column -> accepted header names (case-insensitive; per row, the
+# first of them with a non-empty cell wins, e.g. description then memo)
+_CSV_COLUMNS = {
+    "date": ("date", "transaction date"),
+    "description": ("description", "memo"),
+    "category": ("category",),
+    "amount": ("amount",),
+}
 
-def _csv_cols(row: Dict[str, Any]) -> Dict[str, Any]:
-    # make keys case-insensitive
-    lowered = { (k or "").strip().lower(): v for k, v in row.items() }
+def _csv_col_index(header: List[str]) -> Dict[str, Tuple[int, ...]]:
+    # resolve each canonical column to the positions of its candidate
+    # headers once, in preference order
+    lowered = [(h or "").strip().lower() for h in header]
     return {
-        "date": lowered.get("date") or lowered.get("transaction date") or "",
-        "description": lowered.get("description") or lowered.get("memo") or "",
-        "category": lowered.get("category") or "",
-        "amount": lowered.get("amount") or "",
-        "split": lowered.get("split") or "",
-        "tags": lowered.get("tags") or "",
+        col: tuple(lowered.index(n) for n in names if n in lowered)
+        for col, names in _CSV_COLUMNS.items()
     }
 
-def _entry_id(ts_iso: str, amount: float, desc_norm: str) -> str:
-    # stable id from core attributes so re-uploads are idempotent
-    h = hashlib.sha1(f"{ts_iso[:10]}|{amount:.2f}|{desc_norm}".encode()).hexdigest()[:16]
-    return f"{ts_iso[:10]}-{int(round(amount*100)):d}-{h}"
+def _cell(row: List[str], idxs: Tuple[int, ...]) -> str:
+    # first non-empty candidate cell; short rows / missing columns read as ""
+    for i in idxs:
+        if i < len(row) and row[i]:
+            return row[i]
+    return ""
 
-def _existing_key(ts_iso: str, amount: float) -> Tuple[str, float]:
-    # we dedupe on DATE (yyyy-mm-dd), rounded amount, normalized description
-    return (ts_iso[:10], round(amount, 2))
+def _entry_id(ts_iso: str, amount_cents: int, desc_norm: str) -> str:
+    # stable id from core attributes so re-uploads are idempotent; the hash
+    # is only a name, so a 64-bit BLAKE2b (same 16 hex chars) is plenty
+    h = hashlib.blake2b(f"{ts_iso[:10]}|{amount_cents}|{desc_norm}".encode(), digest_size=8).hexdigest()
+    return f"{ts_iso[:10]}-{amount_cents:d}-{h}"
 
 # --- routes ----------------------------------------------------------------
 
@@ -92,74 +122,70 @@ def upload_ledger_csv():
         flash("No file uploaded", "error")
         return redirect(url_for("ledger_upload.upload_form"))
 
-    # read CSV
-    data = io.StringIO(file.stream.read().decode("utf-8", errors="ignore"))
-    reader = csv.DictReader(data)
-    if not reader.fieldnames:
+    # read CSV: decode incrementally through a 1 MiB buffer instead of
+    # materializing the whole upload as bytes and then as a str
+    # (utf-8-sig drops the BOM Excel puts in front of the first header)
+    buf = io.BufferedReader(file.stream, buffer_size=_CSV_READ_BUFFER)
+    data = io.TextIOWrapper(buf, encoding="utf-8-sig", errors="ignore", newline="")
+    reader = csv.reader(data)
+    header = next(reader, None)
+    if not header:
         flash("CSV missing header row.", "error")
         return redirect(url_for("ledger_upload.upload_form"))
+    col = _csv_col_index(header)
+    i_date, i_desc, i_cat, i_amount = col["date"], col["description"], col["category"], col["amount"]
 
-    # load current index
+    # load current review index + duplicate keys
     idx_path = f"{pref}ledger/review/index.json"
-    idx_path_comp = f"{pref}ledger/index.json"
-    index_comp: List[dict] = store.read_json(idx_path_comp) or []
     index: List[dict] = store.read_json(idx_path) or []
-
-    # build fast duplicate set from existing index
-    existing = set()
-    for r in index_comp:
-        try:
-            ts = (r.get("ts") or "")
-            amt = round(float(r.get("amount") or 0), 2)
-            existing.add(_existing_key(ts, amt))
-        except Exception:
-            continue
+    existing = load_dedupe_keys(store, pref, index)
     inserted = 0
     skipped_dup = 0
     bad_rows = 0
+    review_writes = []  # (path, entry) pairs, uploaded together after parsing
 
-    for raw in reader:
-        cols = _csv_cols(raw)
+    for row in reader:
+        if not row:
+            continue  # blank line
         try:
-            ts_iso = _parse_date_to_iso(cols["date"])
-            amt = abs(round(_to_float(cols["amount"]), 2))
-            note = (cols["description"] or "").strip()
+            ts_iso = _parse_date_to_iso(_cell(row, i_date))
+            amount_cents = abs(to_cents(_cell(row, i_amount)))
+            note = _cell(row, i_desc).strip()
             note_norm = _norm_desc(note)
-            category = (cols["category"] or "").strip() or None
-            split = (cols["split"] or "").strip() or None
-            tags_raw = (cols["tags"] or "").strip()
-            tags = [t.strip() for t in tags_raw.split(",") if t.strip()] or None
+            category = _cell(row, i_cat).strip() or None
+            key = dedupe_key(ts_iso, amount_cents)
         except Exception:
             bad_rows += 1
             continue
 
         # duplicate check
-        key = _existing_key(ts_iso, amt)
         if key in existing:
             skipped_dup += 1
             continue
 
-        kind = "income" if amt > 0 else "expense"
+        kind = "income" if amount_cents > 0 else "expense"
 
-        eid = _entry_id(ts_iso, amt, note_norm)
+        eid = _entry_id(ts_iso, amount_cents, note_norm)
         entry = {
             "id": eid,
             "ts": ts_iso,
-            "amount": abs(amt),
+            "amount": amount_cents / 100,
             "kind": kind,
             "note": note,
             "category": category, 
         }
 
-        # write entry and update index
-        store.write_json(f"{pref}ledger/review/{eid}.json", entry)
+        # queue entry write and update index
+        review_writes.append((f"{pref}ledger/review/{eid}.json", entry))
         index.append(entry)
 
         existing.add(key)
         inserted += 1
 
-    # persist index
+    # persist entries, then the index that points at them, then the keys
+    store.write_json_many(review_writes, max_workers=_WRITE_WORKERS)
     store.write_json(idx_path, index)
+    store.write_json(dedupe_path(pref), sorted(existing))
 
     flash(f"Imported {inserted} new transactions. Skipped {skipped_dup} duplicates. Bad rows: {bad_rows}.", "success")
     return redirect(url_for("ledger_upload.review"))
@@ -177,13 +203,13 @@ def review():
     showing = "Showing all transactions in the review inbox (no filters)"
 
     # Newest first; no filtering
-    rows = sorted(index, key=lambda x: x.get("ts", ""), reverse=True)
+    rows = heapq.nlargest(_REVIEW_PAGE_SIZE, index, key=lambda x: x.get("ts", ""))
 
     # Select options
     types = ["expense", "income", "transfer", "debt_payment"]
 
     # Derive categories from inbox (or fall back to defaults)
-    categories = COST_TYPES.copy()
+    categories = COST_TYPES
 
     # Account/debt options from latest.json
     latest = store.read_json(f"{pref}latest.json") or {}
@@ -200,7 +226,7 @@ def review():
 
     return render_template(
         "ledger_review.html",
-        rows=rows[:1000],  # adjust page size as you like
+        rows=rows,
         types=types,
         categories=categories,
         account_options=account_options,
@@ -220,18 +246,23 @@ def save_review():
     # --- review inbox ---
     review_idx_path = f"{pref}ledger/review/index.json"
     review_index = store.read_json(review_idx_path) or []
-    review_by_id = {r.get("id"): r for r in review_index}
 
-    # --- main ledger index (load once) ---
-    main_idx_path = f"{pref}ledger/index.json"
-    main_index = store.read_json(main_idx_path) or []
+    # ids the form actually touched ("type-<id>", "note-<id>", ...)
+    edited = {k.split("-", 1)[1] for k in form if k.startswith(_EDIT_FIELD_PREFIXES)}
+    edited_rows = [r for r in review_index if r.get("id") in edited]
+
+    # nothing touched: skip loading latest/main index and every rewrite
+    if not edited_rows:
+        flash("Applied 0 transaction(s) from review.", "success")
+        if (form.get("batch") or "").strip():
+            return redirect(url_for("ledger_upload.review", batch=form.get("batch")))
+        return redirect(url_for("ledger_upload.review"))
 
     # --- current state ---
     latest_path = f"{pref}latest.json"
     latest = store.read_json(latest_path) or {}
 
-    allowed_types = {"expense", "income", "transfer", "debt_payment"}
-    processed_ids = []
+    processed_ids = set()
     new_index_rows = []   # collect index rows to append once
     changed_count = 0
 
@@ -241,23 +272,26 @@ def save_review():
         to_raw = to_raw.strip()
         if not to_raw:
             return None, None
-        if to_raw.startswith("debt::"):
-            return None, to_raw.split("debt::", 1)[1].strip() or None
+        before, sep, after = to_raw.partition(_DEBT_PREFIX)
+        if sep and not before:
+            return None, after.strip() or None
         return to_raw, None
 
-    # iterate only over rows present in the submitted form
-    for rid, r in list(review_by_id.items()):
+    # entry/snapshot blobs are independent per row, so they are collected and
+    # written in parallel; latest.json is written once with the final state
+    blob_writes = []
+    # iterate only over rows present in the submitted form (inbox order)
+    for r in edited_rows:
+        rid = r.get("id")
         k_type = f"type-{rid}"; k_cat = f"category-{rid}"; k_note = f"note-{rid}"
         k_from = f"from-{rid}"; k_to = f"to-{rid}"
-        if not any(k in form for k in (k_type, k_cat, k_note, k_from, k_to)):
-            continue
 
         base_kind = (r.get("kind") or "").lower()
         base_ts = r.get("ts") or now_iso()
         base_amount = float(r.get("amount") or 0.0)
 
         new_type = (form.get(k_type) or "").strip().lower() or base_kind
-        if new_type not in allowed_types:
+        if new_type not in ALLOWED_TYPES:
             new_type = base_kind
 
         new_cat = (form.get(k_cat) or "").strip() or None
@@ -288,26 +322,33 @@ def save_review():
 
         updated, entry = apply_transaction(latest, tx)
 
-        # write entry
+        # queue entry write
         entry_path = f"{pref}ledger/entries/{entry['id'].replace(':','-')}.json"
-        store.write_json(entry_path, entry)
+        blob_writes.append((entry_path, entry))
 
         idx_path, d_entry = normalize_entry(user_id, entry)
 
         # collect index row (don’t write yet)
         new_index_rows.append(d_entry)
 
-        # snapshot + latest
+        # queue snapshot; deep-copied because apply_transaction mutates the
+        # account/debt dicts in place and later rows would leak into it
         snap_ts = entry["id"].replace(":", "-")
-        store.write_json(f"{pref}snapshots/{snap_ts}.json", updated)
-        store.write_json(f"{pref}latest.json", updated)
+        blob_writes.append((f"{pref}snapshots/{snap_ts}.json", deepcopy(updated)))
         latest = updated
 
-        processed_ids.append(rid)
+        processed_ids.add(rid)
         changed_count += 1
 
-    # single write to main index
+    store.write_json_many(blob_writes, max_workers=_WRITE_WORKERS)
+
+    if processed_ids:
+        store.write_json(latest_path, latest)
+
+    # single write to main index (only loaded when there is something to add)
     if new_index_rows:
+        main_idx_path = f"{pref}ledger/index.json"
+        main_index = store.read_json(main_idx_path) or []
         main_index.extend(new_index_rows)
         store.write_json(main_idx_path, main_index)
 
@@ -21,61 +21,74 @@ def onboarding_form():
     latest = current_app.gcs.read_json(f"{pref}latest.json") or {}
     return render_template("onboarding.html", profile=latest)
 
+def _to_bool(x: str) -> bool:
+    return x.lower() == "true"
+
+# (form prefix, fields, casts) for each repeating group on the form
+_INCOME_GROUP = ("incomes",
+                 ("name", "amount", "interval", "after_tax"),
+                 {"amount": float, "after_tax": _to_bool})
+_COST_GROUP = ("costs",
+               ("name", "amount", "interval", "type"),
+               {"amount": float})
+_DEBT_GROUP = ("debts",
+               ("name", "balance", "apr", "min_payment", "due_day", "type",
+                "escrow", "interest_portion", "principal_portion"),
+               {"balance": float,
+                "apr": float,
+                "min_payment": float,
+                "due_day": int,
+                "escrow": float,
+                "interest_portion": float,
+                "principal_portion": float})
+_ACCOUNT_GROUP = ("accounts",
+                  ("name", "balance", "type"),
+                  {"balance": float})
+
+VALID_ACCOUNT_TYPES = frozenset({"cash", "checking", "savings", "investment", "retirement"})
+
+def collect_group(form, group):
+    """Zip the `<prefix>-<field>[]` lists back into row dicts, dropping empty rows."""
+    prefix, fields, cast_map = group
+    getlist = form.getlist
+    lists = {k: getlist(f"{prefix}-{k}[]") for k in fields}
+    max_len = max((len(v) for v in lists.values()), default=0)
+    items = []
+    for i in range(max_len):
+        row = {}
+        empty = True
+        for k in fields:
+            vals = lists[k]
+            v = vals[i].strip() if i < len(vals) else ""
+            if v != "":
+                empty = False
+            cast = cast_map.get(k)
+            if cast is not None:
+                try:
+                    v = cast(v) if v != "" else None
+                except Exception:
+                    v = None
+            row[k] = v
+        if not empty:
+            items.append(row)
+    return items
+
 @bp.post("/onboarding")
 def onboarding_submit():
-    def collect_group(prefix, fields, cast_map=None):
-        cast_map = cast_map or {}
-        lists = {k: request.form.getlist(f"{prefix}-{k}[]") for k in fields}
-        max_len = max((len(v) for v in lists.values()), default=0)
-        items = []
-        for i in range(max_len):
-            row = {}
-            empty = True
-            for k in fields:
-                vals = lists.get(k, [])
-                v = vals[i].strip() if i < len(vals) else ""
-                if v != "":
-                    empty = False
-                if k in (cast_map or {}):
-                    try:
-                        v = cast_map[k](v) if v != "" else None
-                    except Exception:
-                        v = None
-                row[k] = v
-            if not empty:
-                items.append(row)
-        return items
-
     _, user_id = current_user_identity()
-    currency = (request.form.get("currency") or "USD").upper()
-    notes = request.form.get("notes", "").strip()
-    household_size = int(request.form.get("household_size") or 1)
-    has_employer_plan = (request.form.get("has_employer_plan") == "on")
-    employer_match_pct_on_salary = float(request.form.get("employer_match_pct_on_salary") or 0)
-    employer_match_rate = float(request.form.get("employer_match_rate") or 0)
+    form = request.form
+    currency = (form.get("currency") or "USD").upper()
+    notes = form.get("notes", "").strip()
+    household_size = int(form.get("household_size") or 1)
+    has_employer_plan = (form.get("has_employer_plan") == "on")
+    employer_match_pct_on_salary = float(form.get("employer_match_pct_on_salary") or 0)
+    employer_match_rate = float(form.get("employer_match_rate") or 0)
 
-    incomes = collect_group("incomes",
-                            ["name","amount","interval","after_tax"],
-                            {"amount": float, "after_tax": lambda x: x.lower()=="true"})
-    costs   = collect_group("costs",
-                            ["name","amount","interval","type"],
-                            {"amount": float})
-    debts = collect_group("debts",
-                            ["name","balance","apr","min_payment","due_day","type",
-                            "escrow","interest_portion","principal_portion"],
-                            {"balance": float,
-                                "apr": float,
-                                "min_payment": float,
-                                "due_day": int,
-                                "escrow": float,
-                                "interest_portion": float,
-                                "principal_portion": float})
+    incomes  = collect_group(form, _INCOME_GROUP)
+    costs    = collect_group(form, _COST_GROUP)
+    debts    = collect_group(form, _DEBT_GROUP)
+    accounts = collect_group(form, _ACCOUNT_GROUP)
 
-    accounts = collect_group("accounts",
-                            ["name", "balance", "type"],
-                            {"balance": float})
-    
-    VALID_TYPES = {"cash","checking","savings","investment","retirement"}
     errors = []
     for i, a in enumerate(accounts, start=1):
         has_any = any(a.get(k) not in (None, "",) for k in ("name","balance","type"))
@@ -83,7 +96,7 @@ def onboarding_submit():
             continue  # completely empty row, drop it
         if not a.get("type"):
             errors.append(f"Accounts row {i}: type is required.")
-        elif str(a["type"]).lower() not in VALID_TYPES:
+        elif str(a["type"]).lower() not in VALID_ACCOUNT_TYPES:
             errors.append(f"Accounts row {i}: invalid type '{a['type']}'.")
         else:
             a["type"] = str(a["type"]).lower()
@@ -1,15 +1,18 @@
 # app/blueprints/plan.py
-from flask import Blueprint, current_app, jsonify, redirect, render_template, url_for, request
-from ..logic.plan_engine import compute_plan, simulate_debt_payoff, MONTH_FACTORS, update_accounts_snapshot
+from flask import Blueprint, current_app, jsonify, make_response, redirect, render_template, url_for, request
+from ..logic.plan_engine import compute_plan, simulate_debt_payoff, CASH_TYPES, MONTH_FACTORS, update_accounts_snapshot
 from ..logic.weekly_budget import build_weekly_budget
-from ..services.utils import current_user_identity, get_json_from_gcs, user_prefix
-from math import ceil, log
+from ..services.utils import BoundedCache, current_user_identity, get_json_from_gcs, user_prefix, read_json_cached
+from math import ceil, log, log1p
+import hashlib
+import json
+import os
+import time
 from flask import session, redirect, url_for
 from app.services.utils import get_valid_types
 
 
 STEPS_CFG_PATH = "config/plan_steps.json"
-CASH_TYPES = {"cash","checking","savings"}
 bp = Blueprint("plan", __name__, url_prefix="")
 
 # @bp.before_request
@@ -24,10 +27,110 @@ def _to_float(x) -> float:
     except Exception:
         return 0.0
 
+# last raw steps config seen + its str-keyed copy
+_steps_cfg_memo: dict = {"raw": None, "by_step": {}}
+
+def _steps_cfg() -> dict:
+    """
+    Step copy keyed by str(step). get_json_from_gcs caches the config
+    in-process and revalidates it against the blob generation every 60s,
+    handing back the same object while it is unchanged, so the str-key
+    normalization only reruns when the config actually changes.
+    """
+    raw = get_json_from_gcs(
+        current_app.config["GCS_BUCKET"], STEPS_CFG_PATH,
+        default={}, ttl=60, client=current_app.gcs.client,
+    ) or {}
+    if raw is not _steps_cfg_memo["raw"]:
+        _steps_cfg_memo["by_step"] = {str(k): v for k, v in raw.items()}
+        _steps_cfg_memo["raw"] = raw
+    return _steps_cfg_memo["by_step"]
+
+# in-process caches: key -> (expires_at, value); both keyed on the profile
+# digest, so an edited latest.json never hits a stale entry
+_PLAN_TTL = 30
+_CACHE_MAX = 256
+_plan_cache = BoundedCache(_CACHE_MAX)    # (user_id, digest) -> (expires_at, plan)
+_payoff_cache = BoundedCache(_CACHE_MAX)  # (user_id, digest, strategy) -> (expires_at, payoff)
+# user_id -> generated_at of the last plan view_plan persisted successfully
+_plan_written = BoundedCache(4096)
+
+# mixed into page ETags so a new deploy's templates are never masked by a 304
+_RENDER_VERSION = os.getenv("K_REVISION") or str(time.time())
+
+def _profile_digest(latest: dict) -> str:
+    return hashlib.blake2b(
+        json.dumps(latest, sort_keys=True).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+def _ttl_memo(cache: BoundedCache, key, compute):
+    now = time.time()
+    hit = cache.get(key)
+    if hit and now < hit[0]:
+        return hit[1]
+
+    value = compute()
+    # when full, expired entries go first, then the oldest insert
+    cache.set(key, (now + _PLAN_TTL, value), stale=lambda v: v[0] <= now)
+    return value
+
+def _mark_plan_written(user_id: str, generated_at: str, futures: list) -> None:
+    # record the plan as persisted once every write has succeeded; a failed
+    # write leaves the marker alone, so the next /plan view retries it
+    def done(_):
+        if all(f.done() and f.exception() is None for f in futures):
+            _plan_written.set(user_id, generated_at)
+    for f in futures:
+        f.add_done_callback(done)
+
+def _cached_plan(user_id: str, latest: dict, digest: str | None = None) -> dict:
+    """
+    compute_plan(latest), cached per user on a digest of the profile.
+    Entries expire after _PLAN_TTL seconds. The plan is shared between
+    requests, so callers must treat it as read-only.
+    """
+    key = (user_id, digest or _profile_digest(latest))
+    return _ttl_memo(_plan_cache, key, lambda: compute_plan(latest))
+
+def _step2_payoff(latest: dict, plan: dict, strategy: str) -> dict:
+    # One-month required costs, as computed by compute_plan
+    monthly_required = plan["derived"]["monthly_required"]
+
+    # Cash now (strict by account type, already computed into plan)
+    cash_now = float(plan.get("cash_now", 0.0))
+
+    # Step 2 EF target = $1,000
+    ef_now_capped = min(max(0.0, cash_now - monthly_required), 1000.0)
+
+    # Amounts we’ll actually use in the sim
+    lump_available = max(0.0, cash_now - monthly_required - ef_now_capped)
+    monthly_extra  = max(0.0, float(plan["monthly"]["leftover"]))
+
+    # HIGH-INTEREST SET: filter directly from latest snapshot (APR ≥ 10, balance > 0);
+    # each field is converted once and reused for both the filter and the row
+    hi_debts = []
+    for d in latest.get("debts", []) or []:
+        apr = float(d.get("apr") or 0)
+        bal = float(d.get("balance") or 0)
+        if apr >= 10 and bal > 0:
+            hi_debts.append({
+                "name": d.get("name") or "",
+                "balance": bal,
+                "apr": apr,
+                "min_payment": float(d.get("min_payment") or 0),
+            })
+
+    return simulate_debt_payoff(
+        debts=hi_debts,
+        monthly_extra=monthly_extra,
+        lump_sum=lump_available,
+        order=strategy,
+    )
+
 def _to_monthly(amount, interval):
     if amount is None:
         return 0.0
-    return float(amount) * MONTH_FACTORS.get((interval or "monthly").lower(), 1)
+    return float(amount) * MONTH_FACTORS.get((interval or "monthly").lower(), 1.0)
 
 def _months_to_payoff(balance: float, apr_percent: float, min_payment: float) -> int | None:
     """
@@ -44,19 +147,29 @@ def _months_to_payoff(balance: float, apr_percent: float, min_payment: float) ->
     if r == 0:
         return ceil(B / P)
     # If payment <= monthly interest, balance never decreases
-    if P <= r * B:
+    interest = r * B
+    if P <= interest:
         return None
-    n = log(P / (P - r * B)) / log(1 + r)
+    n = log(P / (P - interest)) / log1p(r)
     return int(ceil(n))
 
 @bp.get("/overview")
 def overview():
     _, user_id = current_user_identity()
     pref = user_prefix(user_id)
-    latest = current_app.gcs.read_json(f"{pref}latest.json") or {}
+    latest = read_json_cached(current_app.gcs, f"{pref}latest.json") or {}
     if not latest:
         return redirect(url_for("onboarding.onboarding_form"))
 
+    # the page is a pure function of the profile: let the browser revalidate
+    # and skip plan + render entirely when nothing changed
+    digest = _profile_digest(latest)
+    etag = hashlib.blake2b(
+        f"{_RENDER_VERSION}|{user_id}|{digest}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+    if request.if_none_match.contains(etag):
+        return _with_etag(make_response("", 304), etag)
+
     # pull arrays
     incomes  = latest.get("income_streams", []) or []
     costs    = latest.get("recurring_costs", []) or []
@@ -64,85 +177,85 @@ def overview():
     accounts = latest.get("accounts", []) or []
     hh       = int(latest.get("household_size") or 1)
 
-    # cash_now (strict by type)
+    # one pass per collection: totals for the plan math + table rows together
     cash_now = 0.0
-    for a in accounts:
-        if (a.get("type") or "").lower() in CASH_TYPES:
-            cash_now += float(a.get("balance") or 0)
-
-    # monthly expenses consistent with plan_engine
-    costs_monthly = sum(_to_monthly(c.get("amount"), c.get("interval")) for c in costs)
-    min_payments  = sum(float(d.get("min_payment") or 0) for d in debts)
-    groceries     = 400 * hh
-    monthly_required = costs_monthly + min_payments + groceries
-
-    # plan
-    from ..logic.plan_engine import compute_plan
-    plan = compute_plan(latest)
-
-    # current-step EF target (your existing thresholds)
-    six_target = monthly_required * 6
-    twelve_target = monthly_required * 12
-    if plan["current_step"] <= 2:
-        ef_target = 1000.0
-    elif plan["current_step"] <= 5:
-        ef_target = six_target
-    elif plan["current_step"] <= 6:
-        ef_target = twelve_target
-    else:
-        ef_target = twelve_target
-
-    ef_now = max(0.0, cash_now - monthly_required)
-    ef_now = min(ef_now, ef_target)
-
-    # Available = cash after reserving 1-month costs AND the step EF
-    available = max(0.0, cash_now - monthly_required - ef_now)
-
     accounts_rows = []
     total_accounts_balance = 0.0
-    for a in latest.get("accounts", []) or []:
+    for a in accounts:
         bal = _to_float(a.get("balance"))
+        atype = a.get("type") or ""
+        if atype and atype.lower() in CASH_TYPES:
+            cash_now += bal
         if a.get("name"):
             accounts_rows.append({
                 "name":  a.get("name") or "",
                 "balance": round(bal, 2),
-                "type": (a.get("type") or ""),
+                "type": atype,
             })
         total_accounts_balance += bal
-    accounts_rows.sort(key=lambda x: (x["balance"] or 0), reverse=True)
 
+    # monthly expenses consistent with plan_engine
+    costs_monthly = 0.0
+    cost_rows = []
+    for c in costs:
+        amount = c.get("amount")
+        monthly = _to_monthly(amount, c.get("interval"))
+        costs_monthly += monthly
+        if amount and amount > 0:
+            cost_rows.append({
+                "name": c.get("name") or "",
+                "type": (c.get("type") or ""),
+                "amount_monthly": round(monthly, 2),
+                "interval": (c.get("interval") or "monthly")
+            })
 
-    # debts sorted by APR, with months to payoff using min payments
+    # debts with months to payoff using min payments
+    min_payments = 0.0
     debts_rows = []
     total_debt_balance = 0.0
     for d in debts:
         bal = float(d.get("balance") or 0)
-        apr = float(d.get("apr") or 0)
         mp  = float(d.get("min_payment") or 0)
-        months = _months_to_payoff(bal, apr, mp)
+        min_payments += mp
         if bal > 0:
+            apr = float(d.get("apr") or 0)
             debts_rows.append({
                 "name": d.get("name") or "",
                 "balance": round(bal, 2),
                 "apr": round(apr, 2),
                 "min_payment": round(mp, 2),
-                "months_to_payoff": months,
+                "months_to_payoff": _months_to_payoff(bal, apr, mp),
             })
             total_debt_balance += bal
-    debts_rows.sort(key=lambda x: x["apr"], reverse=True)
 
-    # costs (include the new type)
-    cost_rows = []
-    for c in costs:
-        if c.get("amount") and c.get("amount", -1) > 0:
-            cost_rows.append({
-                "name": c.get("name") or "",
-                "type": (c.get("type") or ""),
-                "amount_monthly": round(_to_monthly(c.get("amount"), c.get("interval")), 2),
-                "interval": (c.get("interval") or "monthly")
-            })
+    accounts_rows.sort(key=lambda x: (x["balance"] or 0), reverse=True)
+    debts_rows.sort(key=lambda x: x["apr"], reverse=True)
     cost_rows.sort(key=lambda x: (x["type"] or "zzz", -x["amount_monthly"]))
 
+    groceries     = 400 * hh
+    monthly_required = costs_monthly + min_payments + groceries
+
+    # plan
+    plan = _cached_plan(user_id, latest, digest)
+
+    # current-step EF target (your existing thresholds)
+    six_target = monthly_required * 6
+    twelve_target = monthly_required * 12
+    if plan["current_step"] <= 2:
+        ef_target = 1000.0
+    elif plan["current_step"] <= 5:
+        ef_target = six_target
+    elif plan["current_step"] <= 6:
+        ef_target = twelve_target
+    else:
+        ef_target = twelve_target
+
+    ef_now = max(0.0, cash_now - monthly_required)
+    ef_now = min(ef_now, ef_target)
+
+    # Available = cash after reserving 1-month costs AND the step EF
+    available = max(0.0, cash_now - monthly_required - ef_now)
+
     summary = {
         "cash_now": round(cash_now, 2),
         "ef_now": round(ef_now, 2),
@@ -154,7 +267,7 @@ def overview():
 
     weekly = build_weekly_budget(latest, plan)
 
-    return render_template(
+    resp = make_response(render_template(
         "overview.html",
         accounts=accounts_rows,
         accounts_total=round(total_accounts_balance, 2),
@@ -165,24 +278,30 @@ def overview():
         costs_total=round(costs_monthly, 2),
         weekly=weekly,
         plan=plan,
-    )
+    ))
+    return _with_etag(resp, etag)
+
+def _with_etag(resp, etag: str):
+    # private + no-cache: always revalidated, so an edit shows up immediately
+    resp.set_etag(etag)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    return resp
 
 
 @bp.get("/plan")
 def view_plan():
     _, user_id = current_user_identity()
     pref = user_prefix(user_id)
-    latest = current_app.gcs.read_json(f"{pref}latest.json") or {}
+    latest = read_json_cached(current_app.gcs, f"{pref}latest.json") or {}
     if not latest:
         return redirect(url_for("onboarding.onboarding_form"))
 
-    plan = compute_plan(latest)
+    digest = _profile_digest(latest)
+    plan = _cached_plan(user_id, latest, digest)
 
     # Load step copy (you already have this in your file; omitted for brevity)
-    from ..services.utils import get_json_from_gcs
-    STEPS_CFG_PATH = "config/plan_steps.json"
-    steps_cfg = get_json_from_gcs(current_app.config["GCS_BUCKET"], STEPS_CFG_PATH, default={}, ttl=300) or {}
-    steps_cfg = {str(k): v for k, v in steps_cfg.items()}
+    steps_cfg = _steps_cfg()
     step_copy = steps_cfg.get(str(plan["current_step"]), {})
 
     # --- NEW: strategy + payoff simulation for Step 2
@@ -190,58 +309,23 @@ def view_plan():
     if strategy not in ("avalanche", "snowball"):
         strategy = "avalanche"
 
+    # Step-2 payoff: same profile + strategy (e.g. toggling back and forth)
+    # reuses the simulation instead of rerunning it
     payoff = None
     if plan["current_step"] <= 2:
-        # One-month required costs (same as compute_plan)
-        latest_costs = latest.get("recurring_costs", []) or []
-        latest_debts = latest.get("debts", []) or []
-        hh = int(latest.get("household_size") or 1)
-
-        def _to_monthly(amount, interval):
-            MONTH_FACTORS = {"monthly": 1, "biweekly": 26/12, "weekly": 52/12, "annual": 1/12}
-            if amount is None:
-                return 0.0
-            return float(amount) * MONTH_FACTORS.get((interval or "monthly").lower(), 1)
-
-        costs_monthly = sum(_to_monthly(c.get("amount"), c.get("interval")) for c in latest_costs)
-        min_payments  = sum(float(d.get("min_payment") or 0) for d in latest_debts)
-        groceries     = 400 * hh
-        monthly_required = costs_monthly + min_payments + groceries
-
-        # Cash now (strict by account type, already computed into plan)
-        cash_now = float(plan.get("cash_now", 0.0))
-
-        # Step 2 EF target = $1,000
-        ef_now_capped = min(max(0.0, cash_now - monthly_required), 1000.0)
-
-        # Amounts we’ll actually use in the sim
-        lump_available = max(0.0, cash_now - monthly_required - ef_now_capped)
-        monthly_extra  = max(0.0, float(plan["monthly"]["leftover"]))
-
-        # HIGH-INTEREST SET: filter directly from latest snapshot (APR ≥ 10, balance > 0)
-        hi_debts = [
-            {
-                "name": d.get("name") or "",
-                "balance": float(d.get("balance") or 0),
-                "apr": float(d.get("apr") or 0),
-                "min_payment": float(d.get("min_payment") or 0),
-            }
-            for d in latest_debts
-            if float(d.get("apr") or 0) >= 10 and float(d.get("balance") or 0) > 0
-        ]
-
-        # Run the sim
-        payoff = simulate_debt_payoff(
-            debts=hi_debts,
-            monthly_extra=monthly_extra,
-            lump_sum=lump_available,
-            order=strategy,
+        payoff = _ttl_memo(
+            _payoff_cache, (user_id, digest, strategy),
+            lambda: _step2_payoff(latest, plan, strategy),
         )
 
-    # persist history (unchanged)
-    ts = plan["generated_at"].replace(":", "-")
-    current_app.gcs.write_json(f"profiles/{user_id}/plans/{ts}.json", plan)
-    current_app.gcs.write_json(f"profiles/{user_id}/plan-latest.json", plan)
+    # persist history off the response path; a cached plan that was already
+    # written (same generated_at) is not rewritten
+    if _plan_written.get(user_id) != plan["generated_at"]:
+        ts = plan["generated_at"].replace(":", "-")
+        _mark_plan_written(user_id, plan["generated_at"], [
+            current_app.gcs.write_json_background(f"profiles/{user_id}/plans/{ts}.json", plan),
+            current_app.gcs.write_json_background(f"profiles/{user_id}/plan-latest.json", plan),
+        ])
 
     return render_template("plan.html",
                            plan=plan,
@@ -249,6 +333,17 @@ def view_plan():
                            strategy=strategy,
                            payoff=payoff)
 
+@bp.get("/plan.json")
+def plan_json():
+    # served from the same in-process plan memo as /plan, so a /plan then
+    # /plan.json pair costs one latest.json read and no plan-latest.json read
+    _, user_id = current_user_identity()
+    pref = user_prefix(user_id)
+    latest = read_json_cached(current_app.gcs, f"{pref}latest.json") or {}
+    if not latest:
+        return redirect(url_for("onboarding.onboarding_form"))
+    return jsonify(_cached_plan(user_id, latest))
+
 @bp.get("/plan/accounts")
 def edit_accounts():
     _, user_id = current_user_identity()
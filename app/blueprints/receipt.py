@@ -2,9 +2,25 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for
 
 from ..logic import receipt  # where your send_email lives too
+from ..services.utils import form_fields
 
 bp = Blueprint("receipts", __name__, url_prefix="/receipts")
 
+# (form field, label) for required fields, in the order missing ones are reported;
+# field names double as send_rent_receipt keyword arguments
+_RENT_RECEIPT_REQUIRED = (
+    ("renter_first", "First name"),
+    ("renter_last", "Last name"),
+    ("renter_email", "Renter email"),
+    ("rental_address", "Rental address"),
+    ("date_paid", "Date paid"),
+    ("month_covered", "Month covered"),
+    ("amount_paid", "Amount paid"),
+    ("payment_method", "Payment method"),
+    ("payment_status", "Payment status"),
+)
+_RENT_RECEIPT_FIELDS = tuple(k for k, _ in _RENT_RECEIPT_REQUIRED) + ("check_number",)
+
 
 @bp.get("/")
 def index():
@@ -15,34 +31,11 @@ def index():
 @bp.route("/rent", methods=["GET", "POST"])
 def new_rent_receipt():
     if request.method == "POST":
-        renter_first = (request.form.get("renter_first") or "").strip()
-        renter_last = (request.form.get("renter_last") or "").strip()
-        renter_email = (request.form.get("renter_email") or "").strip()
-
-        rental_address = (request.form.get("rental_address") or "").strip()
-        date_paid = (request.form.get("date_paid") or "").strip()
-        month_covered = (request.form.get("month_covered") or "").strip()
-
-        amount_paid = (request.form.get("amount_paid") or "").strip()
-        payment_status = (request.form.get("payment_status") or "").strip()
-        payment_method = (request.form.get("payment_method") or "").strip()
-        check_number = (request.form.get("check_number") or "").strip() or None
+        fields = dict(zip(_RENT_RECEIPT_FIELDS, form_fields(request.form, _RENT_RECEIPT_FIELDS)))
+        fields["check_number"] = fields["check_number"] or None
 
         # Basic validation (keep it minimal for now)
-        missing = []
-        for k, v in [
-            ("First name", renter_first),
-            ("Last name", renter_last),
-            ("Renter email", renter_email),
-            ("Rental address", rental_address),
-            ("Date paid", date_paid),
-            ("Month covered", month_covered),
-            ("Amount paid", amount_paid),
-            ("Payment method", payment_method),
-            ("Payment status", payment_status),
-        ]:
-            if not v:
-                missing.append(k)
+        missing = [label for key, label in _RENT_RECEIPT_REQUIRED if not fields[key]]
 
         if missing:
             flash(f"Missing required fields: {', '.join(missing)}", "error")
@@ -51,18 +44,7 @@ def new_rent_receipt():
                 form=request.form,
             )
 
-        ok, err = receipt.send_rent_receipt(
-            renter_first=renter_first,
-            renter_last=renter_last,
-            renter_email=renter_email,
-            rental_address=rental_address,
-            date_paid=date_paid,
-            month_covered=month_covered,
-            amount_paid=amount_paid,
-            payment_status=payment_status,
-            payment_method=payment_method,
-            check_number=check_number,
-        )
+        ok, err = receipt.send_rent_receipt(**fields)
 
         if not ok:
             flash(err or "Failed to send receipt.", "error")
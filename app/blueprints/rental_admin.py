@@ -1,5 +1,7 @@
 import time
-import uuid
+import mimetypes
+from secrets import token_hex
+from concurrent.futures import ThreadPoolExecutor
 
 # routing / rendering
 from flask import (
@@ -19,15 +21,23 @@ from flask import (
     send_file,
 )
 
-import io
+from werkzeug.utils import secure_filename
 
 from ..services.utils import (
     current_user_identity,
     user_prefix,
     tenant_directory_path,
+    forget_tenant_directory,
     build_coverage_grid,
-    parse_ymd
+    parse_ymd,
+    read_json_cached,
+    read_json_cached_many,
+    write_json_cached,
+    save_receipts,
+    load_tenant_receipts,
+    form_fields,
 )
+from ..services.gcs import write_json_all
 
 bp = Blueprint("rental_admin", __name__, url_prefix="/rental-admin")
 
@@ -35,6 +45,19 @@ import datetime as dt
 
 PROPERTIES_PATH = "rentals/properties.json"
 
+# form field names per POST handler, in the order the handlers unpack them
+_PROPERTY_FIELDS = ("address", "price", "tenant")
+_TENANT_FIELDS = ("first_name", "last_name", "email", "property_id", "lease_start", "lease_end")
+_RECEIPT_FIELDS = ("covered_month", "date_paid", "amount", "payment_method", "status",
+                   "check_number", "notes")
+
+def _receipt_file_name(content_type: str | None) -> str:
+    # fallback receipt name with an extension matching its type ("receipt.pdf"),
+    # like the lease's "lease.pdf", so downloads keep a type hint
+    ctype = (content_type or "").split(";", 1)[0].strip()
+    ext = ".pdf" if ctype == "application/pdf" else mimetypes.guess_extension(ctype) or ""
+    return f"receipt{ext}"
+
 
 def _properties_path() -> str:
     _, user_id = current_user_identity()
@@ -43,12 +66,12 @@ def _properties_path() -> str:
 
 
 def _load_properties() -> dict:
-    data = current_app.gcs.read_json(_properties_path()) or {}
+    data = read_json_cached(current_app.gcs, _properties_path()) or {}
     return data if isinstance(data, dict) else {}
 
 
 def _save_properties(properties: dict) -> None:
-    current_app.gcs.write_json(_properties_path(), properties)
+    write_json_cached(current_app.gcs, _properties_path(), properties)
 
 
 def _is_owner() -> bool:
@@ -77,35 +100,33 @@ def property_list():
     properties = _load_properties()
 
     if request.method == "POST":
-        address = (request.form.get("address") or "").strip()
-
-        price_raw = (request.form.get("price") or "").strip()
+        address, price_raw, tenant = form_fields(request.form, _PROPERTY_FIELDS)
         try:
             price = float(price_raw) if price_raw != "" else None
         except ValueError:
             price = None
+        tenant = tenant or "Vacant"
 
-        tenant = (request.form.get("tenant") or "").strip() or "Vacant"
-
-        missing = []
-        if not address:
-            missing.append("address")
-        if price is None:
-            missing.append("price")
+        # price may legitimately be 0, so it is checked for None
+        missing = [name for name, ok in (
+            ("address", address),
+            ("price", price is not None),
+        ) if not ok]
 
         if missing:
             flash(f"Missing or invalid: {', '.join(missing)}", "error")
             return render_template("rental_admin/property_list.html", properties=properties, form=request.form)
 
-        property_id = f"p_{uuid.uuid4().hex[:10]}"
+        property_id = f"p_{token_hex(5)}"
+        now = int(time.time())
 
         properties[property_id] = {
             "property_id": property_id,
             "address": address,
             "price": price,
             "tenant": tenant,
-            "created_at": int(time.time()),
-            "updated_at": int(time.time()),
+            "created_at": now,
+            "updated_at": now,
         }
 
         _save_properties(properties)
@@ -127,15 +148,12 @@ def property_edit(property_id: str):
         return redirect(url_for("rental_admin.property_list"))
 
     if request.method == "POST":
-        address = (request.form.get("address") or "").strip()
-
-        price_raw = (request.form.get("price") or "").strip()
+        address, price_raw, tenant = form_fields(request.form, _PROPERTY_FIELDS)
         try:
             price = float(price_raw) if price_raw != "" else None
         except ValueError:
             price = None
-
-        tenant = (request.form.get("tenant") or "").strip() or "Vacant"
+        tenant = tenant or "Vacant"
 
         if not address or price is None:
             flash("Address and valid price are required.", "error")
@@ -171,14 +189,20 @@ def _leases_prefix() -> str:
     return f"{pref}rentals/leases/"  # folder-like prefix
 
 def _load_tenants():
-    data = current_app.gcs.read_json(_tenants_path()) or {}
+    data = read_json_cached(current_app.gcs, _tenants_path()) or {}
     for t in data.values():
         t.setdefault("email", None)
         t.setdefault("lease", {})
     return data
 
+def _load_tenants_and_properties():
+    # both blobs fetched concurrently into the request memo, then normalized
+    # by the usual loaders
+    read_json_cached_many(current_app.gcs, (_tenants_path(), _properties_path()))
+    return _load_tenants(), _load_properties()
+
 def _save_tenants(tenants: dict) -> None:
-    current_app.gcs.write_json(_tenants_path(), tenants)
+    write_json_cached(current_app.gcs, _tenants_path(), tenants)
 
 def lease_is_active(tenant: dict, now_utc: dt.datetime | None = None) -> bool:
     """
@@ -189,31 +213,19 @@ def lease_is_active(tenant: dict, now_utc: dt.datetime | None = None) -> bool:
     - missing start_date → treat as started
     """
 
-    if now_utc is None:
-        now_utc = dt.datetime.utcnow().replace(microsecond=0)
-
     lease = (tenant or {}).get("lease") or {}
 
-    start_dt = None
-    end_dt = None
-
-    try:
-        if lease.get("start_date"):
-            start_dt = parse_ymd(lease["start_date"])
-    except Exception:
-        pass
-
-    try:
-        if lease.get("end_date"):
-            end_dt = parse_ymd(lease["end_date"])
-    except Exception:
-        pass
-
-    # No end date → safest assumption is still active
+    # No (valid) end date → safest assumption is still active; decided
+    # before touching start_date or the clock
+    end_dt = _lease_date(lease, "end_date")
     if end_dt is None:
         return True
 
+    if now_utc is None:
+        now_utc = dt.datetime.utcnow().replace(microsecond=0)
+
     # If start exists and hasn't begun → not active
+    start_dt = _lease_date(lease, "start_date")
     if start_dt is not None and now_utc < start_dt:
         return False
 
@@ -221,28 +233,37 @@ def lease_is_active(tenant: dict, now_utc: dt.datetime | None = None) -> bool:
     return now_utc < end_dt
 
 
+def _lease_date(lease: dict, key: str) -> dt.datetime | None:
+    # parse_ymd is memoized; unparseable dates count as missing
+    value = lease.get(key)
+    if not value:
+        return None
+    try:
+        return parse_ymd(value)
+    except Exception:
+        return None
+
+
 # =========================================================
 # Tenant List
 # =========================================================
 
 @bp.route("/tenants", methods=["GET", "POST"])
 def tenant_list():
-    tenants = _load_tenants()
-    properties = _load_properties()  # from your existing code
+    tenants, properties = _load_tenants_and_properties()
 
     if request.method == "POST":
-        first_name = (request.form.get("first_name") or "").strip()
-        last_name  = (request.form.get("last_name") or "").strip()
-        email = (request.form.get("email") or "").strip().lower()
-        property_id = (request.form.get("property_id") or "").strip()
-
-        lease_start = (request.form.get("lease_start") or "").strip()  # YYYY-MM-DD
-        lease_end = (request.form.get("lease_end") or "").strip()
+        # lease dates are YYYY-MM-DD
+        first_name, last_name, email, property_id, lease_start, lease_end = form_fields(
+            request.form, _TENANT_FIELDS
+        )
+        email = email.lower()
 
-        missing = []
-        if not first_name: missing.append("first_name")
-        if not last_name: missing.append("last_name")
-        if not property_id: missing.append("property")
+        missing = [name for name, value in (
+            ("first_name", first_name),
+            ("last_name", last_name),
+            ("property", property_id),
+        ) if not value]
 
         if missing:
             flash(f"Missing: {', '.join(missing)}", "error")
@@ -253,7 +274,7 @@ def tenant_list():
                 form=request.form,
             )
 
-        tenant_id = f"t_{uuid.uuid4().hex[:10]}"
+        tenant_id = f"t_{token_hex(5)}"
         now = int(time.time())
 
         tenants[tenant_id] = {
@@ -274,6 +295,20 @@ def tenant_list():
             "updated_at": now,
         }
 
+        # the tenant record lands first: if it fails nothing was saved and
+        # the owner can simply retry
+        try:
+            _save_tenants(tenants)
+        except Exception:
+            current_app.logger.exception("Failed to save new tenant %s", tenant_id)
+            flash("Could not save the tenant. Please try again.", "error")
+            return redirect(url_for("rental_admin.tenant_list"))
+
+        # the property link and directory entry only point at the saved
+        # tenant, so they are written concurrently afterwards;
+        # (store, path, obj, what the owner is told failed)
+        links = []
+
         # Link property -> tenant_id (single-tenant model for now)
         prop = properties.get(property_id)
         if prop:
@@ -281,23 +316,42 @@ def tenant_list():
             prop["tenant"] = f"{first_name} {last_name}"  # optional display field
             prop["updated_at"] = now
             properties[property_id] = prop
-            _save_properties(properties)
+            links.append((current_app.gcs, _properties_path(), properties, "the property link"))
 
-        _save_tenants(tenants)
         # REGISTER TENANT IN GLOBAL TENANT DIRECTORY
         if email:
             _, owner_user_id = current_user_identity()
-            now = int(time.time())
-
-            current_app.config_store.write_json(
+            links.append((
+                current_app.config_store,
                 tenant_directory_path(email),
                 {
                     "owner_user_id": owner_user_id,
                     "tenant_id": tenant_id,
                     "active": True,
                     "updated_at": now,
-                }
+                },
+                "the tenant portal sign-in entry (they can't sign in yet)",
+            ))
+
+        with ThreadPoolExecutor(max_workers=max(len(links), 1)) as pool:
+            pending = [(pool.submit(store.write_json, path, obj), what) for store, path, obj, what in links]
+        if email:
+            forget_tenant_directory(email)
+
+        failed = []
+        for fut, what in pending:
+            exc = fut.exception()
+            if exc is not None:
+                current_app.logger.error("Failed to save %s for tenant %s", what, tenant_id, exc_info=exc)
+                failed.append(what)
+        if failed:
+            flash(
+                f"Tenant added, but saving {' and '.join(failed)} failed. "
+                "Adding the tenant again would create a duplicate.",
+                "error",
             )
+            return redirect(url_for("rental_admin.tenant_list"))
+
         flash("Tenant added.", "success")
         return redirect(url_for("rental_admin.tenant_list"))
 
@@ -314,8 +368,7 @@ def tenant_list():
 
 @bp.route("/tenants/<tenant_id>", methods=["GET", "POST"])
 def tenant_edit(tenant_id: str):
-    tenants = _load_tenants()
-    properties = _load_properties()
+    tenants, properties = _load_tenants_and_properties()
     t = tenants.get(tenant_id)
 
     if not t:
@@ -327,14 +380,10 @@ def tenant_edit(tenant_id: str):
         t["lease"] = {}
 
     if request.method == "POST":
-        first_name = (request.form.get("first_name") or "").strip()
-        last_name = (request.form.get("last_name") or "").strip()
-        email = (request.form.get("email") or "").strip().lower()
-        property_id = (request.form.get("property_id") or "").strip()
-
-        lease_start = (request.form.get("lease_start") or "").strip()
-        lease_end = (request.form.get("lease_end") or "").strip()
-
+        first_name, last_name, email, property_id, lease_start, lease_end = form_fields(
+            request.form, _TENANT_FIELDS
+        )
+        email = email.lower()
 
         if not first_name or not last_name or not property_id:
             flash("First name, last name, and property are required.", "error")
@@ -346,28 +395,29 @@ def tenant_edit(tenant_id: str):
 
         else:
             # Update tenant fields
+            now = int(time.time())
             t["first_name"] = first_name
             t["last_name"] = last_name
             t["email"] = email
             t["property_id"] = property_id
             t["lease"]["start_date"] = lease_start
             t["lease"]["end_date"] = lease_end
-            t["updated_at"] = int(time.time())
+            t["updated_at"] = now
 
             # Optional lease PDF upload
             file = request.files.get("lease_file")
             if file and file.filename:
-                safe_name = file.filename.replace("/", "_")
+                # strips path separators, control chars and leading dots
+                safe_name = secure_filename(file.filename) or "lease.pdf"
                 content_type = file.content_type or "application/pdf"
-                data = file.read()
 
                 lease_path = f"{_leases_prefix()}{tenant_id}/{safe_name}"
-                current_app.gcs.write_bytes(lease_path, data, content_type=content_type)
+                current_app.gcs.write_stream(lease_path, file.stream, content_type=content_type)
 
                 t["lease"]["file_path"] = lease_path
                 t["lease"]["file_name"] = safe_name
                 t["lease"]["content_type"] = content_type
-                t["lease"]["uploaded_at"] = int(time.time())
+                t["lease"]["uploaded_at"] = now
 
             tenants[tenant_id] = t
             _save_tenants(tenants)
@@ -377,12 +427,9 @@ def tenant_edit(tenant_id: str):
             return redirect(url_for("rental_admin.tenant_edit", tenant_id=tenant_id))
 
     # Receipts + Lease Coverage context for GET (and POST errors)
-    all_receipts = _load_receipts() or {}
-
-    tenant_receipts = {
-        rid: r for rid, r in all_receipts.items()
-        if isinstance(r, dict) and r.get("tenant_id") == tenant_id
-    }
+    # only this tenant's shard is read, not every tenant's receipts
+    _, user_id = current_user_identity()
+    tenant_receipts = load_tenant_receipts(current_app.gcs, user_id, tenant_id, _load_receipts)
 
     # Sort newest-first by covered_month then date_paid (both strings)
     tenant_receipts = dict(
@@ -411,8 +458,7 @@ def tenant_edit(tenant_id: str):
 # =========================================================
 @bp.route("/tenants/<tenant_id>/delete", methods=["POST"])
 def delete_tenant(tenant_id):
-    tenants = _load_tenants()
-    properties = _load_properties()
+    tenants, properties = _load_tenants_and_properties()
 
     tenant = tenants.get(tenant_id)
     if not tenant:
@@ -426,6 +472,10 @@ def delete_tenant(tenant_id):
         return redirect(url_for("rental_admin.tenant_list"))
 
 
+    # Remove tenant record; independent blobs, so they are written concurrently below
+    tenants.pop(tenant_id)
+    writes = [(current_app.gcs, _tenants_path(), tenants)]
+
     # Unlink property
     property_id = tenant.get("property_id")
     if property_id and property_id in properties:
@@ -437,29 +487,31 @@ def delete_tenant(tenant_id):
             prop["updated_at"] = now
             properties[property_id] = prop
 
-        _save_properties(properties)
+        writes.append((current_app.gcs, _properties_path(), properties))
 
-    # Delete lease file (if exists)
+    # Best-effort cleanup (lease file, global tenant directory) runs alongside
+    # the record writes instead of as extra sequential round-trips.
+    cleanup = []
     lease = tenant.get("lease", {})
     file_path = lease.get("file_path")
-
     if file_path:
-        try:
-            current_app.storage.delete(file_path)
-        except Exception:
-            current_app.logger.warning("Failed to delete lease file", exc_info=True)
+        cleanup.append((current_app.gcs, file_path, "Failed to delete lease file"))
 
-    # Remove from global tenant directory
     email = tenant.get("email")
     if email:
-        try:
-            current_app.config_store.delete(tenant_directory_path(email))
-        except Exception:
-            current_app.logger.warning("Failed to delete tenant directory entry", exc_info=True)
+        cleanup.append((current_app.config_store, tenant_directory_path(email),
+                        "Failed to delete tenant directory entry"))
 
-    # Remove tenant record
-    tenants.pop(tenant_id)
-    _save_tenants(tenants)
+    with ThreadPoolExecutor(max_workers=max(len(cleanup), 1)) as pool:
+        pending = [(pool.submit(store.delete, path), msg) for store, path, msg in cleanup]
+        write_json_all(writes)
+    if email:
+        forget_tenant_directory(email)
+
+    for fut, msg in pending:
+        exc = fut.exception()
+        if exc is not None:
+            current_app.logger.warning(msg, exc_info=exc)
 
     flash("Tenant deleted.", "success")
     return redirect(url_for("rental_admin.tenant_list"))
@@ -486,14 +538,14 @@ def tenant_lease_view(tenant_id: str):
         flash("No lease file uploaded for this tenant.", "error")
         return redirect(url_for("rental_admin.tenant_edit", tenant_id=tenant_id))
 
-    data = current_app.gcs.read_bytes(path)
-    if not data:
+    stream = current_app.gcs.open(path)
+    if stream is None:
         flash("Lease file missing in storage.", "error")
         return redirect(url_for("rental_admin.tenant_edit", tenant_id=tenant_id))
 
     # inline=True opens in-browser for PDFs
     return send_file(
-        io.BytesIO(data),
+        stream,
         mimetype=content_type,
         as_attachment=False,
         download_name=filename,
@@ -521,14 +573,14 @@ def tenant_lease_download(tenant_id: str):
         flash("No lease file uploaded for this tenant.", "error")
         return redirect(url_for("rental_admin.tenant_edit", tenant_id=tenant_id))
 
-    data = current_app.gcs.read_bytes(path)
-    if not data:
+    stream = current_app.gcs.open(path)
+    if stream is None:
         flash("Lease file missing in storage.", "error")
         return redirect(url_for("rental_admin.tenant_edit", tenant_id=tenant_id))
 
     # as_attachment=True forces download
     return send_file(
-        io.BytesIO(data),
+        stream,
         mimetype=content_type,
         as_attachment=True,
         download_name=filename,
@@ -550,11 +602,12 @@ def _receipts_prefix() -> str:
     return f"{user_prefix(user_id)}rentals/receipts/"
 
 def _load_receipts() -> dict:
-    data = current_app.gcs.read_json(_receipts_path()) or {}
+    data = read_json_cached(current_app.gcs, _receipts_path()) or {}
     return data if isinstance(data, dict) else {}
 
-def _save_receipts(receipts: dict) -> None:
-    current_app.gcs.write_json(_receipts_path(), receipts)
+def _save_receipts(receipts: dict, tenant_id: str) -> None:
+    _, user_id = current_user_identity()
+    save_receipts(current_app.gcs, user_id, receipts, tenant_id)
 
 # =========================================================
 # Receipt Upload + View + Download
@@ -568,14 +621,11 @@ def tenant_receipt_upload(tenant_id: str):
         flash("Tenant not found.", "error")
         return redirect(url_for("rental_admin.tenant_list"))
 
-    # Required fields
-    covered_month = (request.form.get("covered_month") or "").strip()  # expect YYYY-MM
-    date_paid = (request.form.get("date_paid") or "").strip()          # YYYY-MM-DD
-    amount_raw = (request.form.get("amount") or "").strip()
-    payment_method = (request.form.get("payment_method") or "").strip()
-    status = (request.form.get("status") or "").strip()
-    check_number = (request.form.get("check_number") or "").strip() or None
-    notes = (request.form.get("notes") or "").strip() or None
+    # covered_month is YYYY-MM, date_paid YYYY-MM-DD; check_number/notes optional
+    (covered_month, date_paid, amount_raw, payment_method, status,
+     check_number, notes) = form_fields(request.form, _RECEIPT_FIELDS)
+    check_number = check_number or None
+    notes = notes or None
 
     # Parse amount
     try:
@@ -583,29 +633,29 @@ def tenant_receipt_upload(tenant_id: str):
     except ValueError:
         amount = None
 
-    missing = []
-    if not covered_month: missing.append("covered_month")
-    if not date_paid: missing.append("date_paid")
-    if amount is None: missing.append("amount")
-    if not payment_method: missing.append("payment_method")
-    if not status: missing.append("status")
-
     file = request.files.get("receipt_file")
-    if not file or not file.filename:
-        missing.append("receipt_file")
+
+    # amount may legitimately be 0, so it is checked for None
+    missing = [name for name, ok in (
+        ("covered_month", covered_month),
+        ("date_paid", date_paid),
+        ("amount", amount is not None),
+        ("payment_method", payment_method),
+        ("status", status),
+        ("receipt_file", file and file.filename),
+    ) if not ok]
 
     if missing:
         flash(f"Missing or invalid: {', '.join(missing)}", "error")
         return redirect(url_for("rental_admin.tenant_edit", tenant_id=tenant_id))
 
     # Upload file
-    receipt_id = f"r_{uuid.uuid4().hex[:10]}"
-    safe_name = file.filename.replace("/", "_")
+    receipt_id = f"r_{token_hex(5)}"
     content_type = file.content_type or "application/pdf"
-    data = file.read()
+    safe_name = secure_filename(file.filename) or _receipt_file_name(content_type)
 
     receipt_path = f"{_receipts_prefix()}{tenant_id}/{receipt_id}/{safe_name}"
-    current_app.gcs.write_bytes(receipt_path, data, content_type=content_type)
+    current_app.gcs.write_stream(receipt_path, file.stream, content_type=content_type)
 
     now = int(time.time())
     receipts = _load_receipts()
@@ -629,7 +679,7 @@ def tenant_receipt_upload(tenant_id: str):
         "created_at": now,
         "updated_at": now,
     }
-    _save_receipts(receipts)
+    _save_receipts(receipts, tenant_id)
 
     flash("Receipt uploaded.", "success")
     return redirect(url_for("rental_admin.tenant_edit", tenant_id=tenant_id))
@@ -644,16 +694,15 @@ def receipt_view(receipt_id: str):
 
     f = r.get("file") or {}
     path = f.get("file_path")
-    name = f.get("file_name") or "receipt"
     ctype = f.get("content_type") or "application/octet-stream"
+    name = f.get("file_name") or _receipt_file_name(ctype)
 
-    data = current_app.gcs.read_bytes(path) if path else None
-    if not data:
+    stream = current_app.gcs.open(path) if path else None
+    if stream is None:
         flash("Receipt file missing in storage.", "error")
         return redirect(url_for("rental_admin.tenant_edit", tenant_id=r.get("tenant_id")))
 
-    import io
-    return send_file(io.BytesIO(data), mimetype=ctype, as_attachment=False, download_name=name, max_age=0)
+    return send_file(stream, mimetype=ctype, as_attachment=False, download_name=name, max_age=0)
 
 
 @bp.get("/receipts/<receipt_id>/download")
@@ -666,16 +715,15 @@ def receipt_download(receipt_id: str):
 
     f = r.get("file") or {}
     path = f.get("file_path")
-    name = f.get("file_name") or "receipt"
     ctype = f.get("content_type") or "application/octet-stream"
+    name = f.get("file_name") or _receipt_file_name(ctype)
 
-    data = current_app.gcs.read_bytes(path) if path else None
-    if not data:
+    stream = current_app.gcs.open(path) if path else None
+    if stream is None:
         flash("Receipt file missing in storage.", "error")
         return redirect(url_for("rental_admin.tenant_edit", tenant_id=r.get("tenant_id")))
 
-    import io
-    return send_file(io.BytesIO(data), mimetype=ctype, as_attachment=True, download_name=name, max_age=0)
+    return send_file(stream, mimetype=ctype, as_attachment=True, download_name=name, max_age=0)
 
 @bp.get("/receipts/<receipt_id>")
 def receipt_detail(receipt_id: str):
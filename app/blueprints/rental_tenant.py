@@ -1,11 +1,8 @@
 # app/blueprints/rental_tenant.py
 from __future__ import annotations
-from email import policy
 import os
-import uuid
 import stripe
 
-import io
 import datetime as dt
 from flask import (
     Blueprint,
@@ -16,12 +13,18 @@ from flask import (
     url_for,
     flash,
     request,
-    Response
+    Response,
+    g,
 )
 from ..services.utils import (
-    tenant_directory_path,
+    BoundedCache,
+    read_tenant_directory,
     parse_ymd,
-    build_coverage_grid
+    build_coverage_grid,
+    read_json_revalidated,
+    read_json_revalidated_many,
+    receipts_for_tenant,
+    tenant_receipts_path,
 )
 
 
@@ -33,42 +36,99 @@ def _current_tenant_email() -> str | None:
     return (session.get("user_email") or "").strip().lower() or None
 
 def _load_tenant_context_for_email(email: str):
-    # 1) lookup global tenant directory entry
-    dir_path = tenant_directory_path(email)
-    entry = current_app.config_store.read_json(dir_path)
+    # 1) lookup global tenant directory entry (briefly cached in-process)
+    entry = read_tenant_directory(email)
 
     if not entry or not entry.get("active"):
-        return None, None, None, None, None, "Email not recognized as an active tenant."
+        return None, None, None, None, "Email not recognized as an active tenant."
 
     owner_user_id = entry.get("owner_user_id")
     tenant_id = entry.get("tenant_id")
     if not owner_user_id or not tenant_id:
-        return None, None, None, None, None, "Tenant directory entry is missing owner_user_id or tenant_id."
+        return None, None, None, None, "Tenant directory entry is missing owner_user_id or tenant_id."
 
     # 2) load owner’s rentals data
     tenants_path  = f"profiles/{owner_user_id}/rentals/tenants.json"
     props_path    = f"profiles/{owner_user_id}/rentals/properties.json"
-    receipts_path = f"profiles/{owner_user_id}/rentals/receipts.json"
 
-    tenants = current_app.gcs.read_json(tenants_path) or {}
-    properties = current_app.gcs.read_json(props_path) or {}
-    all_receipts = current_app.gcs.read_json(receipts_path) or {}
+    # the portal only reads these, so the parsed dicts can be reused across
+    # requests until the owner (or the Stripe webhook) rewrites a blob;
+    # memoized for the request too, as the receipt routes look receipts up again.
+    # The three blobs are revalidated/fetched concurrently.
+    tenants, properties, shard = read_json_revalidated_many(
+        current_app.gcs,
+        (tenants_path, props_path, tenant_receipts_path(owner_user_id, tenant_id)),
+    )
+    tenants = tenants or {}
+    properties = properties or {}
 
     tenant = tenants.get(tenant_id)
     if not tenant:
-        return None, None, None, None, None, "Tenant record not found."
+        return None, None, None, None, "Tenant record not found."
 
-    # 3) filter receipts to tenant
-    tenant_receipts = {
-        rid: r for rid, r in all_receipts.items()
-        if (r or {}).get("tenant_id") == tenant_id
-    }
+    # 3) this tenant's receipts
+    tenant_receipts = shard if shard is not None else _tenant_receipts(owner_user_id, tenant_id)
+
+    # the coverage grid is built by tenant_portal, the only page that shows it
+    return entry, tenant, properties, tenant_receipts, None
+
+
+# (owner_user_id, tenant_id) -> (tenant, tenant_receipts, coverage_grid)
+_coverage_cache = BoundedCache(1024)
+
+def _coverage_grid_for(owner_user_id: str, tenant_id: str, tenant: dict, tenant_receipts: dict) -> list[dict]:
+    """
+    build_coverage_grid, reused while tenant and tenant_receipts are the very
+    objects it was built from: read_json_revalidated hands back the same parsed
+    dicts until their blobs change, so identity means the data is unchanged.
+    The grid doesn't depend on the clock, only on the lease and receipts.
+    """
+    key = (owner_user_id, tenant_id)
+    hit = _coverage_cache.get(key)
+    if hit and hit[0] is tenant and hit[1] is tenant_receipts:
+        return hit[2]
+
+    _, _, coverage_grid = build_coverage_grid(tenant, tenant_receipts)
+    _coverage_cache.set(key, (tenant, tenant_receipts, coverage_grid))
+    return coverage_grid
+
+def _tenant_receipts(owner_user_id: str, tenant_id: str) -> dict:
+    """
+    The tenant's receipts from their per-tenant shard, written alongside
+    receipts.json by every receipt save. Tenants with no receipt saved since
+    shards were introduced have none yet, so fall back to filtering the full
+    receipts.json (not backfilled here: the portal only reads, and a shard
+    rebuilt from a read that raced a webhook write would go stale).
+    """
+    shard = read_json_revalidated(current_app.gcs, tenant_receipts_path(owner_user_id, tenant_id))
+    if shard is not None:
+        return shard
+    path = f"profiles/{owner_user_id}/rentals/receipts.json"
+    return receipts_for_tenant(read_json_revalidated(current_app.gcs, path), tenant_id)
 
-    # 4) coverage grid
-    lease_months, coverage_map, coverage_grid = build_coverage_grid(tenant, tenant_receipts)
+def _receipts_by_month(tenant_receipts: dict) -> dict[str, list[tuple[str, dict]]]:
+    """
+    tenant_receipts grouped by (stripped) covered_month as (status, receipt)
+    pairs, status stripped and lower-cased; non-dict entries dropped, in the
+    dict's order. Built once per request and shared by the due-month,
+    Stripe-receipt and paid-so-far lookups, so none of them re-check types
+    or re-normalize fields.
+    """
+    memo = g.get("_receipts_by_month")
+    if memo is not None and memo[0] is tenant_receipts:
+        return memo[1]
 
-    return entry, tenant, properties, tenant_receipts, coverage_grid, None
+    by_month: dict[str, list[tuple[str, dict]]] = {}
+    for r in (tenant_receipts or {}).values():
+        if not isinstance(r, dict):
+            continue
+        cm = (r.get("covered_month") or "").strip()
+        if cm:
+            status = (r.get("status") or "").strip().lower()
+            by_month.setdefault(cm, []).append((status, r))
 
+    g._receipts_by_month = (tenant_receipts, by_month)
+    return by_month
 
 def compute_next_payment_due(
     tenant: dict,
@@ -80,7 +140,7 @@ def compute_next_payment_due(
     A month is considered covered ONLY if there is a receipt with status "Paid in full".
     """
     if now_utc is None:
-        now_utc = dt.datetime.utcnow().replace(microsecond=0)
+        now_utc = dt.datetime.utcnow()
 
     lease = (tenant or {}).get("lease") or {}
     if not lease.get("start_date") or not lease.get("end_date"):
@@ -95,35 +155,20 @@ def compute_next_payment_due(
     if now_utc >= end_dt:
         return None
 
-    def ym(d: dt.datetime) -> str:
-        return d.strftime("%Y-%m")
-
-    def iter_months(start: dt.datetime, end: dt.datetime):
-        cur = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        endm = end.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        while cur < endm:
-            yield cur
-            y, m = cur.year, cur.month
-            cur = cur.replace(year=y + (m // 12), month=(m % 12) + 1)
-
     # Covered months are ONLY those paid-in-full (ignore "Partial", ignore NSF/returned)
-    covered_full = set()
-    for _, r in (tenant_receipts or {}).items():
-        if not isinstance(r, dict):
-            continue
-        cm = (r.get("covered_month") or "").strip()
-        if not cm:
-            continue
-        status = (r.get("status") or "").strip().lower()
-        if status == "nsf / returned":
-            continue
-        if status == "paid in full":
-            covered_full.add(cm)
+    covered_full = {
+        cm for cm, rs in _receipts_by_month(tenant_receipts).items()
+        if any(status == "paid in full" for status, _ in rs)
+    }
 
-    search_start = max(now_utc.replace(day=1), start_dt.replace(day=1))
-    for m_start in iter_months(search_start, end_dt):
-        if ym(m_start) not in covered_full:
-            return m_start.date()
+    # months as integers (year * 12 + month - 1): scan from the later of
+    # this month / the lease's first month up to (not including) the end month
+    first = max(now_utc.year * 12 + now_utc.month, start_dt.year * 12 + start_dt.month) - 1
+    last  = end_dt.year * 12 + end_dt.month - 1
+    for v in range(first, last):
+        y, m = divmod(v, 12)
+        if f"{y:04d}-{m + 1:02d}" not in covered_full:
+            return dt.date(y, m + 1, 1)
 
     return None
 
@@ -147,7 +192,7 @@ def _next_due_month_ym(next_due: dt.date | None) -> str | None:
         return None
     return f"{next_due.year:04d}-{next_due.month:02d}"
 
-def _payment_policy(now_local: dt.datetime, due_month_start: dt.datetime, rent: float) -> dict:
+def _payment_policy(now_local: dt.date, due_month_start: dt.date, rent: float) -> dict:
     """
     Rules:
     - If it's before the next month that needs to be paid => allow partial payments.
@@ -180,24 +225,37 @@ def _payment_policy(now_local: dt.datetime, due_month_start: dt.datetime, rent:
         "total_due": total_due,
     }
 
-def _app_base_url() -> str:
-    base = (os.environ.get("APP_BASE_URL") or "").strip()
-    if not base:
-        raise RuntimeError("APP_BASE_URL is not set")
-    if not (base.startswith("http://") or base.startswith("https://")):
+def _normalize_base_url(base: str | None) -> str:
+    base = (base or "").strip()
+    if base and not (base.startswith("http://") or base.startswith("https://")):
         base = "https://" + base
     return base.rstrip("/")
 
-def _find_stripe_receipt_for_month(tenant_receipts: dict, tenant_id: str, covered_month: str) -> dict | None:
+# fixed per deployment, so normalized once at import
+_APP_BASE_URL = _normalize_base_url(os.environ.get("APP_BASE_URL"))
+
+def _app_base_url() -> str:
+    if not _APP_BASE_URL:
+        raise RuntimeError("APP_BASE_URL is not set")
+    return _APP_BASE_URL
+
+def _find_stripe_receipt_for_month(
+    tenant_receipts: dict,
+    tenant_id: str,
+    covered_month: str,
+    payment_method: str | None = None,
+) -> dict | None:
+    """
+    First receipt for tenant_id covering covered_month; with payment_method,
+    only receipts paid that way (checkout looks for an earlier "Stripe" one).
+    """
     if not tenant_receipts or not tenant_id or not covered_month:
         return None
 
-    for _, r in tenant_receipts.items():
-        if not isinstance(r, dict):
-            continue
+    for _, r in _receipts_by_month(tenant_receipts).get(covered_month, ()):
         if r.get("tenant_id") != tenant_id:
             continue
-        if r.get("covered_month") != covered_month:
+        if payment_method is not None and (r.get("payment_method") or "") != payment_method:
             continue
         return r
 
@@ -208,15 +266,10 @@ def _paid_so_far_cents_for_month(tenant_receipts: dict, tenant_id: str, covered_
         return 0
 
     total = 0
-    for _, r in tenant_receipts.items():
-        if not isinstance(r, dict):
-            continue
+    for status, r in _receipts_by_month(tenant_receipts).get(covered_month, ()):
         if (r.get("tenant_id") or "") != tenant_id:
             continue
-        if (r.get("covered_month") or "") != covered_month:
-            continue
 
-        status = (r.get("status") or "").strip().lower()
         if "nsf" in status or "returned" in status:
             continue
 
@@ -246,12 +299,13 @@ def tenant_portal():
         flash("Please sign in.", "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
 
-    entry, tenant, properties, tenant_receipts, coverage_grid, err = _load_tenant_context_for_email(email)
+    entry, tenant, properties, tenant_receipts, err = _load_tenant_context_for_email(email)
     if err:
         flash(err, "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
 
     next_due = compute_next_payment_due(tenant, tenant_receipts)
+    coverage_grid = _coverage_grid_for(entry["owner_user_id"], entry["tenant_id"], tenant, tenant_receipts)
 
     return render_template(
         "rental_tenant/tenant_portal.html",
@@ -273,7 +327,7 @@ def pay():
         flash("Please sign in.", "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
 
-    entry, tenant, properties, tenant_receipts, coverage_grid, err = _load_tenant_context_for_email(email)
+    entry, tenant, properties, tenant_receipts, err = _load_tenant_context_for_email(email)
     if err:
         flash(err, "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
@@ -289,9 +343,9 @@ def pay():
         flash("No payment due (lease may be fully covered or missing dates).", "info")
         return redirect(url_for("rental_tenant.tenant_portal"))
 
-    due_month_start = dt.datetime(next_due.year, next_due.month, 1)
-    now_local = dt.datetime.now()  # simplest for now; swap to a configured tz later if you want
-    policy = _payment_policy(now_local, due_month_start, rent)
+    # next_due is already the 1st of the due month
+    now_local = dt.date.today()  # simplest for now; swap to a configured tz later if you want
+    policy = _payment_policy(now_local, next_due, rent)
 
     # existing receipt for this month? (partial scenario)
     existing = _find_stripe_receipt_for_month(tenant_receipts, entry["tenant_id"], due_ym)
@@ -326,7 +380,7 @@ def create_checkout_session():
         flash("Please sign in.", "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
 
-    entry, tenant, properties, tenant_receipts, coverage_grid, err = _load_tenant_context_for_email(email)
+    entry, tenant, properties, tenant_receipts, err = _load_tenant_context_for_email(email)
     if err:
         flash(err, "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
@@ -346,9 +400,8 @@ def create_checkout_session():
         flash("No payment due.", "info")
         return redirect(url_for("rental_tenant.tenant_portal"))
 
-    due_month_start = dt.datetime(next_due.year, next_due.month, 1)
-    now_local = dt.datetime.now()
-    policy = _payment_policy(now_local, due_month_start, rent)
+    now_local = dt.date.today()
+    policy = _payment_policy(now_local, next_due, rent)
 
     # ----------------------------
     # Amount selection:
@@ -359,27 +412,15 @@ def create_checkout_session():
     # ----------------------------
     total_due = float(policy["total_due"])
     total_due_cents = _money_to_cents(total_due)
+    # converted once; reused by the line items and the Stripe metadata
+    rent_cents = _money_to_cents(rent)
+    late_fee_cents = _money_to_cents(float(policy.get("late_fee", 0.0)))
 
     owner_user_id = entry["owner_user_id"]
     tenant_id = entry["tenant_id"]
     property_id = (tenant or {}).get("property_id") or ""
 
-    def _find_stripe_receipt_for_month(tenant_receipts: dict, tenant_id: str, covered_month: str) -> dict | None:
-        if not tenant_receipts or not tenant_id or not covered_month:
-            return None
-        for _, r in tenant_receipts.items():
-            if not isinstance(r, dict):
-                continue
-            if r.get("tenant_id") != tenant_id:
-                continue
-            if r.get("covered_month") != covered_month:
-                continue
-            if (r.get("payment_method") or "") != "Stripe":
-                continue
-            return r
-        return None
-
-    existing = _find_stripe_receipt_for_month(tenant_receipts, tenant_id, due_ym)
+    existing = _find_stripe_receipt_for_month(tenant_receipts, tenant_id, due_ym, payment_method="Stripe")
     existing_status = ((existing or {}).get("status") or "").strip().lower()
 
     already_paid_cents = _paid_so_far_cents_for_month(tenant_receipts, tenant_id, due_ym)
@@ -420,8 +461,6 @@ def create_checkout_session():
         flash("No payment due.", "info")
         return redirect(url_for("rental_tenant.tenant_portal"))
 
-    # Stripe init
-    stripe.api_key = os.environ["STRIPE_SECRET_KEY"]
     app_base = _app_base_url()
 
     # ----------------------------
@@ -457,7 +496,7 @@ def create_checkout_session():
             "price_data": {
                 "currency": "usd",
                 "product_data": {"name": f"Rent — {due_ym}"},
-                "unit_amount": _money_to_cents(rent),
+                "unit_amount": rent_cents,
             },
             "quantity": 1,
         }]
@@ -466,7 +505,7 @@ def create_checkout_session():
                 "price_data": {
                     "currency": "usd",
                     "product_data": {"name": "Late fee (5%)"},
-                    "unit_amount": _money_to_cents(float(policy["late_fee"])),
+                    "unit_amount": late_fee_cents,
                 },
                 "quantity": 1,
             })
@@ -484,8 +523,8 @@ def create_checkout_session():
             "tenant_id": tenant_id,
             "property_id": property_id,
             "covered_month": due_ym,
-            "rent_cents": str(_money_to_cents(rent)),
-            "late_fee_cents": str(_money_to_cents(float(policy.get("late_fee", 0.0)))),
+            "rent_cents": str(rent_cents),
+            "late_fee_cents": str(late_fee_cents),
             # IMPORTANT: paid_cents = THIS checkout session amount (half/full/remainder)
             "paid_cents": str(amount_cents),
             # IMPORTANT: total_cents = what it takes to fully cover the month (rent + late fee if applicable)
@@ -521,8 +560,7 @@ def _load_receipt_for_tenant(entry: dict, receipt_id: str):
     if not owner_user_id or not tenant_id:
         return None, "Missing tenant directory info."
 
-    path = f"profiles/{owner_user_id}/rentals/receipts.json"
-    receipts = current_app.gcs.read_json(path) or {}
+    receipts = _tenant_receipts(owner_user_id, tenant_id)
 
     r = receipts.get(receipt_id)
     if not r:
@@ -552,7 +590,7 @@ def receipt_view(receipt_id: str):
         flash("Please sign in.", "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
 
-    entry, tenant, properties, tenant_receipts, coverage_grid, err = _load_tenant_context_for_email(email)
+    entry, tenant, properties, tenant_receipts, err = _load_tenant_context_for_email(email)
     if err:
         flash(err, "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
@@ -577,7 +615,7 @@ def receipt_download(receipt_id: str):
         flash("Please sign in.", "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
 
-    entry, tenant, properties, tenant_receipts, coverage_grid, err = _load_tenant_context_for_email(email)
+    entry, tenant, properties, tenant_receipts, err = _load_tenant_context_for_email(email)
     if err:
         flash(err, "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
@@ -635,7 +673,7 @@ def lease_view():
         flash("Please sign in.", "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
 
-    entry, tenant, properties, tenant_receipts, coverage_grid, err = _load_tenant_context_for_email(email)
+    entry, tenant, properties, tenant_receipts, err = _load_tenant_context_for_email(email)
     if err:
         flash(err, "error")
         return redirect(url_for("rental_tenant.tenant_portal"))
@@ -665,7 +703,7 @@ def lease_download():
         flash("Please sign in.", "error")
         return redirect(url_for("auth.login_form", mode="tenant"))
 
-    entry, tenant, properties, tenant_receipts, coverage_grid, err = _load_tenant_context_for_email(email)
+    entry, tenant, properties, tenant_receipts, err = _load_tenant_context_for_email(email)
     if err:
         flash(err, "error")
         return redirect(url_for("rental_tenant.tenant_portal"))
@@ -1,13 +1,14 @@
 # app/blueprints/stripe.py  (DROP-IN replacement for your webhook handler)
 import os
 import time
-import uuid
 import datetime as dt
+from secrets import token_hex
 
 import stripe
 from flask import Blueprint, request, current_app
 
 from ..logic import receipt as receipt_logic 
+from ..services.utils import save_receipts
 bp = Blueprint("stripe_webhook", __name__)
 
 
@@ -20,9 +21,8 @@ def _load_receipts(owner_user_id: str) -> dict:
     return current_app.gcs.read_json(path) or {}
 
 
-def _save_receipts(owner_user_id: str, receipts: dict) -> None:
-    path = f"profiles/{owner_user_id}/rentals/receipts.json"
-    current_app.gcs.write_json(path, receipts)
+def _save_receipts(owner_user_id: str, receipts: dict, tenant_id: str) -> None:
+    save_receipts(current_app.gcs, owner_user_id, receipts, tenant_id)
 
 
 def _int_or_zero(v) -> int:
@@ -108,7 +108,6 @@ def _find_property_address(properties: dict, property_id: str) -> str:
 
 @bp.post("/stripe/webhook")
 def stripe_webhook():
-    stripe.api_key = os.environ["STRIPE_SECRET_KEY"]
     whsec = os.environ.get("STRIPE_WEBHOOK_SECRET", "")
     if not whsec:
         current_app.logger.error("Missing STRIPE_WEBHOOK_SECRET")
@@ -176,7 +175,7 @@ def stripe_webhook():
                             break
 
                 now = int(time.time())
-                receipt_id = existing_id or f"rcpt_{uuid.uuid4().hex[:10]}"
+                receipt_id = existing_id or f"rcpt_{token_hex(5)}"
 
                 prev_paid_cents = 0
                 if existing_id:
@@ -219,7 +218,7 @@ def stripe_webhook():
                     "created_at": (receipts.get(receipt_id) or {}).get("created_at") or now,
                     "updated_at": now,
                 }
-                _save_receipts(owner_user_id, receipts)
+                _save_receipts(owner_user_id, receipts, tenant_id)
 
                 # ---- Send email immediately after payment (half or full) ----
                 # Uses tenant + property info to populate your existing send_rent_receipt API.
@@ -305,7 +304,7 @@ def stripe_webhook():
                         r["email_history"] = hist
                         r["updated_at"] = int(time.time())
                         receipts[receipt_id] = r
-                        _save_receipts(owner_user_id, receipts)
+                        _save_receipts(owner_user_id, receipts, tenant_id)
                 except Exception as e:
                     current_app.logger.exception(f"Failed persisting email status on receipt {receipt_id}: {e}")
 
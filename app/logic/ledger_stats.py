@@ -4,7 +4,7 @@ import datetime as dt
 from collections import defaultdict
 from typing import Dict, Any, List, Optional
 from ..services.utils import (
-    user_prefix, parse_iso, month_window, period_bounds
+    user_prefix, parse_iso, month_window, period_bounds, read_json_cached
 )
 
 
@@ -18,7 +18,7 @@ def compute_ledger_stats(
 ) -> Dict[str, Any]:
     pref = user_prefix(user_id)
     idx_path = f"{pref}ledger/index.json"
-    index: List[dict] = store.read_json(idx_path) or []
+    index: List[dict] = read_json_cached(store, idx_path) or []
 
     # Window selection: custom beats period; if neither, default month.
     if start_iso and end_iso:
@@ -61,7 +61,9 @@ def compute_ledger_stats(
             expenses_by_category[cat] += amt
 
         elif kind == "debt_payment":
-            entry = read_entry(r.get("id", ""))
+            # newer index rows carry principal_portion + balance_after, so only
+            # legacy rows need the per-entry GCS read
+            entry = r if "principal_portion" in r else read_entry(r.get("id", ""))
             principal = float(entry.get("principal_portion") or amt)
             debt_name = r.get("debt_name") or (entry.get("debt_name") or "unknown")
             balance_after = entry.get("balance_after")
@@ -4,8 +4,8 @@ from flask import Blueprint, current_app, jsonify, redirect, render_template, ur
 from ..services.utils import get_json_from_gcs, current_user_identity, user_prefix
 
 
-MONTH_FACTORS = {"monthly":1, "biweekly":26/12, "weekly":52/12, "annual":1/12}
-CASH_TYPES = {"cash", "checking", "savings"}
+MONTH_FACTORS = {"monthly": 1.0, "biweekly": 26/12, "weekly": 52/12, "annual": 1/12}
+CASH_TYPES = frozenset({"cash", "checking", "savings"})
 
 bp = Blueprint("plan", __name__, url_prefix="")
 
@@ -36,7 +36,7 @@ def view_plan():
 
 def _to_monthly(amount, interval):
     if amount is None: return 0.0
-    return float(amount) * MONTH_FACTORS.get((interval or "monthly").lower(), 1)
+    return float(amount) * MONTH_FACTORS.get((interval or "monthly").lower(), 1.0)
 
 # app/logic/plan_engine.py
 
@@ -114,71 +114,62 @@ def simulate_debt_payoff(
     total_interest = 0.0
     months = 0
 
-    def all_paid():
-        return all(d["balance_temp"] <= 1e-8 for d in items)
+    # The monthly loop runs on parallel lists (one slot per debt, in payoff
+    # order) rather than dict lookups; results are written back afterwards.
+    # Order keys (balance, apr) never change inside the loop, so the order
+    # fixed above holds for every month.
+    n = len(items)
+    idx = range(n)
+    bal0 = [d["balance"] for d in items]
+    bal = [d["balance_temp"] for d in items]
+    rate = [d["apr"] / 100.0 / 12.0 for d in items]
+    mtz = [d["months_to_zero"] for d in items]
+    interest_paid = [d["interest_paid"] for d in items]
+    extra_per_month = max(0.0, float(monthly_extra or 0))
 
     # Monthly loop (cap large to avoid infinite loops)
-    while not all_paid() and months < 3600:
+    while months < 3600 and any(b > 1e-8 for b in bal):
         months += 1
 
         # 1) accrue interest
-        for d in items:
-            if d["balance"] <= 0:
+        for k in idx:
+            b = bal[k]
+            if b <= 0:
                 continue
-            if d.get('balance_temp') is None:
-                d['balance_temp'] = d['balance']
-
-            if d.get('balance_temp') <= 0:
-                continue
-            balance_work = d["balance_temp"]
-            r = d["apr"] / 100.0 / 12.0
-            interest = balance_work * r
-            balance_work +=  interest
-            d["interest_paid"] += interest
+            interest = b * rate[k]
+            interest_paid[k] += interest
             total_interest += interest
-            d['balance_temp'] = balance_work
+            bal[k] = b + interest
+
         # 2) pay minimums
-        for d in items:
-            if d["balance"] <= 0:
+        for k in idx:
+            if bal[k] <= 0:
                 continue
-            if d.get('balance_temp') is None:
-                d['balance_temp'] = d['balance']
-            if d.get('balance_temp') <= 0:
-                continue
-            balance_work = d["balance_temp"]
-            p = min(d["min_payment"], balance_work)
-            balance_work = d["balance"] - pay
-            if balance_work <= 1e-8 and d["months_to_zero"] is None:
-                d["months_to_zero"] = months
-                balance_work = 0.0
-            d['balance_temp'] = balance_work
+            b = bal0[k] - pay
+            if b <= 1e-8 and mtz[k] is None:
+                mtz[k] = months
+                b = 0.0
+            bal[k] = b
 
         # 3) apply monthly extra to the current target (first unpaid in order)
-        extra = max(0.0, float(monthly_extra or 0))
-        for d in items:
+        extra = extra_per_month
+        for k in idx:
             if extra <= 1e-8:
                 break
-            if d["balance"] <= 0:
-                continue
-            if d.get('balance_temp') is None:
-                d['balance_temp'] = d['balance']
-            if d.get('balance_temp') <= 0:
+            b = bal[k]
+            if b <= 0:
                 continue
-            balance_work = d["balance_temp"]
-
-            pay = min(d["balance_temp"], extra)
-            d["balance_temp"] = d["balance_temp"] - pay
+            pay = min(b, extra)
             extra -= pay
-            if d["balance_temp"] <= 1e-8 and d["months_to_zero"] is None:
-                d["months_to_zero"] = months
-                balance_work = 0.0
-            d['balance_temp'] = balance_work
-
-        # Re-sort each month if using snowball/avalanche (optional; keeps target fresh)
-        if order == "snowball":
-            items.sort(key=lambda x: (x["balance"], -x["apr"]))
-        else:
-            items.sort(key=lambda x: (-x["apr"], x["balance"]))
+            if b - pay <= 1e-8 and mtz[k] is None:
+                mtz[k] = months
+                b = 0.0
+            bal[k] = b
+
+    for k, d in enumerate(items):
+        d["balance_temp"] = bal[k]
+        d["months_to_zero"] = mtz[k]
+        d["interest_paid"] = interest_paid[k]
 
     # Fill months_to_zero if cleared on final month
     for d in items:
@@ -320,7 +311,15 @@ def compute_plan(snapshot: dict):
         "cash_now": round(cash_now, 2),
         "ef_now": round(ef_now, 2),  # <-- expose for other pages if you want
         "current_step": current,
-        "steps": steps
+        "steps": steps,
+        # unrounded intermediates, so views don't re-walk the snapshot
+        "derived": {
+            "costs_monthly": costs_monthly,
+            "min_payments": min_payments,
+            "groceries": groceries,
+            "monthly_required": monthly_required,
+            "cash_now": cash_now,
+        },
     }
 
 
@@ -1,5 +1,6 @@
-import json, time
-from typing import List, Optional
+import io, json, logging, time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
 from google.cloud import storage
 from google.api_core.exceptions import TooManyRequests
 from google.api_core.retry import Retry
@@ -12,6 +13,14 @@ try:
 except Exception:  # older libs
     GCS_DEFAULT_RETRY = None
 
+# shared by every store for fire-and-forget writes off the request path
+_BACKGROUND_WRITES = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gcs-bg")
+
+def _log_background_failure(fut: Future, path: str):
+    exc = fut.exception()
+    if exc is not None:
+        logging.error("Background write to %s failed", path, exc_info=exc)
+
 class GcsStore:
     def __init__(self, bucket_name: str):
         self.client = storage.Client()
@@ -61,6 +70,22 @@ class GcsStore:
         except Exception:
             return None
 
+    def open(self, path: str, chunk_size: int = 1 << 20):
+        """
+        Open a blob for streaming reads, or None if it is missing or empty.
+        Costs one metadata RPC up front; the body is fetched chunk_size bytes
+        at a time as the caller reads, so memory stays O(chunk_size).
+        """
+        blob = self.bucket.blob(path)
+        try:
+            blob.reload()
+        except gax_exc.NotFound:
+            return None
+        except Exception:
+            return None
+        if not blob.size:
+            return None
+        return blob.open("rb", chunk_size=chunk_size)
 
     def write_bytes(self, path: str, data: bytes, content_type: str = "application/octet-stream"):
         blob = self.bucket.blob(path)
@@ -89,27 +114,107 @@ class GcsStore:
                 time.sleep(backoff)
                 backoff = min(backoff * 2, 8.0)
 
+    def write_stream(self, path: str, fileobj, content_type: str = "application/octet-stream",
+                     size: Optional[int] = None):
+        """
+        Upload from a seekable file object (e.g. an uploaded file's .stream)
+        without reading it into memory first; the client sends it in chunks.
+        Retries rewind to where the stream started. size (bytes left in the
+        stream) is measured by seeking when not given: with a known size,
+        small files go up in one request instead of a resumable session.
+        """
+        blob = self.bucket.blob(path)
+        start = fileobj.tell()
+        if size is None:
+            size = fileobj.seek(0, io.SEEK_END) - start
+            fileobj.seek(start)
+
+        # Try library-level retry first (newer google-cloud-storage)
+        if GCS_DEFAULT_RETRY is not None:
+            try:
+                blob.upload_from_file(fileobj, content_type=content_type, size=size, retry=GCS_DEFAULT_RETRY, timeout=60)
+                return
+            except TypeError:
+                # Some versions don’t accept retry kwarg on this call
+                pass
+            except (gax_exc.TooManyRequests, gax_exc.ServiceUnavailable, gax_exc.DeadlineExceeded):
+                # Fall through to manual backoff below
+                pass
+
+        # Manual exponential backoff for transient errors
+        backoff = 0.5
+        for attempt in range(6):  # ~0.5 + 1 + 2 + 4 + 8 + 8 ~= 23.5s
+            try:
+                fileobj.seek(start)
+                blob.upload_from_file(fileobj, content_type=content_type, size=size, timeout=60)
+                return
+            except (gax_exc.TooManyRequests, gax_exc.ServiceUnavailable, gax_exc.DeadlineExceeded):
+                if attempt == 5:
+                    raise
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 8.0)
 
     def read_json(self, path):
         blob = self.bucket.blob(path)
         try:
-            if not blob.exists():
-                return None
-            text = blob.download_as_text()
+            # single GET; a missing blob surfaces as NotFound (no exists() RTT)
+            data = blob.download_as_bytes()
         except gax_exc.NotFound:
             return None
         except Exception:
             return None
 
-        if text is None or text.strip() == "":
+        if not data or data.isspace():
             return None
         try:
-            return json.loads(text)
+            # json.loads takes the bytes as-is and detects the encoding
+            return json.loads(data)
         except Exception:
             # If someone accidentally wrote plain text or double-encoded JSON,
             # just return None so callers can default safely.
             return None
 
+    def read_json_many(self, paths: Iterable[str], max_workers: int = 16) -> list:
+        """
+        read_json for several paths, fetched concurrently; results come back
+        in the order of paths.
+        """
+        paths = list(paths)
+        if len(paths) <= 1:
+            return [self.read_json(p) for p in paths]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+            return list(pool.map(self.read_json, paths))
+
+    def read_json_if_changed(self, path: str, generation: Optional[int] = None):
+        """
+        (generation, obj) for path; (None, None) if it is missing or unreadable.
+        With a known generation, fetch metadata only and skip the download
+        when it still matches: the same generation comes back and obj is None,
+        so callers keep the copy they already parsed.
+        """
+        try:
+            if generation is None:
+                blob = self.bucket.blob(path)
+            else:
+                blob = self.bucket.get_blob(path)
+                if blob is None:
+                    return None, None
+                if blob.generation == generation:
+                    return generation, None
+            # generation is filled in from the download's response headers
+            data = blob.download_as_bytes()
+        except gax_exc.NotFound:
+            return None, None
+        except Exception:
+            return None, None
+
+        if not data or data.isspace():
+            return blob.generation, None
+        try:
+            return blob.generation, json.loads(data)
+        except Exception:
+            return blob.generation, None
+
     def write_json(self, path, obj):
         # Prefer real delete if obj is None
         if obj is None and hasattr(self, "delete"):
@@ -121,6 +226,25 @@ class GcsStore:
         text = "null" if obj is None else json.dumps(obj, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
         self.write_text(path, text, "application/json")
 
+    def write_json_background(self, path: str, obj) -> Future:
+        """
+        Serialize obj now (so later mutations can't leak into the blob) and
+        upload it on a background thread. Failures are logged, not raised;
+        use only for writes the response doesn't depend on.
+        """
+        text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), allow_nan=False)
+        fut = _BACKGROUND_WRITES.submit(self.write_text, path, text, "application/json")
+        fut.add_done_callback(lambda f: _log_background_failure(f, path))
+        return fut
+
+    def write_json_many(self, items: Iterable[Tuple[str, object]], max_workers: int = 16):
+        """
+        Write several (path, obj) pairs concurrently. Each blob is its own
+        HTTPS round-trip, so a small thread pool hides most of the latency.
+        Waits for every write, then re-raises the first failure (if any).
+        """
+        write_json_all(((self, path, obj) for path, obj in items), max_workers=max_workers)
+
     def list_paths(self, prefix: str) -> List[str]:
         return [b.name for b in self.client.list_blobs(self.bucket, prefix=prefix)]
     
@@ -130,3 +254,20 @@ class GcsStore:
             blob.delete()
         except gax_exc.NotFound:
             pass
+
+
+def write_json_all(writes: Iterable[Tuple["GcsStore", str, object]], max_workers: int = 16):
+    """
+    Like GcsStore.write_json_many, but for (store, path, obj) triples that
+    may span stores (e.g. the user bucket and the config bucket).
+    """
+    writes = list(writes)
+    if len(writes) <= 1:
+        for store, path, obj in writes:
+            store.write_json(path, obj)
+        return
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(writes))) as pool:
+        futures = [pool.submit(store.write_json, path, obj) for store, path, obj in writes]
+    for fut in futures:
+        fut.result()
@@ -6,17 +6,20 @@ import time
 import logging
 import os
 import requests
+import threading
 import datetime as dt
 
+from decimal import Decimal, ROUND_HALF_UP
 from typing import Any, Optional, Tuple
 from google.cloud import storage
 from google.api_core.exceptions import NotFound, Forbidden
-from functools import wraps
-from flask import session, redirect, url_for, current_app
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from flask import session, redirect, url_for, current_app, g, has_app_context
 
 
 # very small in-process TTL cache
-_cache: dict[Tuple[str, str], tuple[float, Any]] = {}
+_cache: dict[Tuple[str, str], tuple[float, Any, Optional[int]]] = {}
 
 import hashlib
 import base64
@@ -62,6 +65,116 @@ def user_prefix(user_id: str) -> str:
     # All your user data lives under this prefix
     return f"profiles/{user_id}/"
 
+def read_json_cached(store, path: str) -> Any:
+    """
+    store.read_json(path), memoized on flask.g for the rest of the request,
+    so helpers that each need latest.json / index.json share one GCS GET.
+    The object is shared; plain store.write_json doesn't update the memo
+    (write_json_cached does).
+    """
+    if not has_app_context():
+        return store.read_json(path)
+    memo = g.setdefault("_json_reads", {})
+    key = (id(store), path)
+    if key not in memo:
+        memo[key] = store.read_json(path)
+    return memo[key]
+
+def read_json_cached_many(store, paths) -> list:
+    """
+    read_json_cached for several paths at once; the ones not memoized yet
+    are fetched concurrently (one round-trip of latency instead of N).
+    """
+    if not has_app_context():
+        return store.read_json_many(paths)
+    memo = g.setdefault("_json_reads", {})
+    sid = id(store)
+    missing = [p for p in paths if (sid, p) not in memo]
+    if missing:
+        for p, val in zip(missing, store.read_json_many(missing)):
+            memo[(sid, p)] = val
+    return [memo[(sid, p)] for p in paths]
+
+def write_json_cached(store, path: str, obj: Any) -> None:
+    """
+    store.write_json(path, obj), keeping the read_json_cached memo in step
+    so later reads in the same request see what was just written.
+    """
+    store.write_json(path, obj)
+    if has_app_context():
+        g.setdefault("_json_reads", {})[(id(store), path)] = obj
+
+
+class BoundedCache:
+    """
+    Small in-process dict shared by the worker's request threads. Every
+    operation holds a lock, and inserting a new key into a full cache first
+    drops the entries `stale(value)` flags (if given), then the oldest insert.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: dict = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key, value, stale=None) -> None:
+        with self._lock:
+            data = self._data
+            if key not in data and len(data) >= self.maxsize:
+                if stale is not None:
+                    for k in [k for k, v in data.items() if stale(v)]:
+                        del data[k]
+                if len(data) >= self.maxsize:
+                    del data[next(iter(data))]
+            data[key] = value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+# (bucket, path) -> (generation, parsed object); see read_json_revalidated
+_revalidated = BoundedCache(512)
+
+def _revalidate(store, path: str) -> Any:
+    ckey = (store.bucket.name, path)
+    cached = _revalidated.get(ckey)
+    gen, val = store.read_json_if_changed(path, cached[0] if cached else None)
+    if cached and gen == cached[0]:
+        return cached[1]
+    if gen is None:
+        _revalidated.pop(ckey, None)
+    else:
+        _revalidated.set(ckey, (gen, val))
+    return val
+
+def read_json_revalidated(store, path: str) -> Any:
+    """
+    read_json_cached that also keeps the parsed object across requests.
+    The first lookup in a request costs one metadata GET; the blob is only
+    downloaded and parsed again when its generation has changed, so it is
+    never stale. The object is shared between requests: read-only callers only.
+    """
+    return read_json_revalidated_many(store, (path,))[0]
+
+def read_json_revalidated_many(store, paths) -> list:
+    """
+    read_json_revalidated for several paths; the ones not memoized yet are
+    revalidated concurrently, so N blobs cost one round-trip of latency.
+    """
+    memo = g.setdefault("_json_reads", {}) if has_app_context() else {}
+    sid = id(store)
+    missing = [p for p in paths if (sid, p) not in memo]
+    if len(missing) == 1:
+        memo[(sid, missing[0])] = _revalidate(store, missing[0])
+    elif missing:
+        with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+            vals = list(pool.map(lambda p: _revalidate(store, p), missing))
+        for p, val in zip(missing, vals):
+            memo[(sid, p)] = val
+    return [memo[(sid, p)] for p in paths]
 
 def get_json_from_gcs(
     bucket: str,
@@ -74,22 +187,33 @@ def get_json_from_gcs(
     """
     Read a JSON object from GCS: gs://<bucket>/<path>
     - Returns `default` if the object doesn't exist or can't be parsed.
-    - Optional TTL (seconds) to cache reads in-process.
+    - Optional TTL (seconds) to cache reads in-process. Once an entry
+      expires, only the blob's metadata is fetched; if its generation is
+      unchanged the cached object is kept (same identity) for another TTL.
     - You may pass an existing google.cloud.storage.Client via `client`.
     """
     key = (bucket, path)
     now = time.time()
 
-    if ttl and key in _cache:
-        exp, val = _cache[key]
-        if now < exp:
-            return val
+    cached = _cache.get(key) if ttl else None
+    if cached and now < cached[0]:
+        return cached[1]
 
     if client is None:
         client = storage.Client()
 
     try:
-        blob = client.bucket(bucket).blob(path)
+        if cached and cached[2] is not None:
+            # revalidate: metadata GET only, full download only on change
+            blob = client.bucket(bucket).get_blob(path)
+            if blob is None:
+                _cache.pop(key, None)
+                return default
+            if blob.generation == cached[2]:
+                _cache[key] = (now + ttl, cached[1], cached[2])
+                return cached[1]
+        else:
+            blob = client.bucket(bucket).blob(path)
         text = blob.download_as_text()  # utf-8
         val = json.loads(text)
     except NotFound:
@@ -102,9 +226,16 @@ def get_json_from_gcs(
         return default
 
     if ttl:
-        _cache[key] = (now + ttl, val)
+        # generation comes from the download response headers (None on
+        # libraries that don't expose it → plain TTL refetch next time)
+        _cache[key] = (now + ttl, val, blob.generation)
     return val
 
+def form_fields(form, names: tuple[str, ...]) -> tuple[str, ...]:
+    """(form.get(name) or "").strip() for each name, in order, for unpacking."""
+    get = form.get
+    return tuple((get(n) or "").strip() for n in names)
+
 def login_required(fn):
     @wraps(fn)
     def wrapper(*args, **kwargs):
@@ -212,8 +343,13 @@ def parse_iso(s: str) -> Optional[dt.datetime]:
     except Exception:
         return None
 
+@lru_cache(maxsize=4096)
 def parse_ymd(s: str) -> dt.datetime:
-    """Strict YYYY-MM-DD (or ISO) → naive UTC datetime; raises on failure."""
+    """
+    Strict YYYY-MM-DD (or ISO) → naive UTC datetime; raises on failure.
+    Memoized: lease/receipt dates repeat across tenants and requests, and
+    datetimes are immutable (failures aren't cached, they re-raise).
+    """
     s = (s or "").strip()
     if not s:
         raise ValueError("empty")
@@ -298,6 +434,7 @@ def normalize_entry(user_id: str, entry: dict):
         "from_account": entry.get("from_account"),
         "to_account": entry.get("to_account"),
         "debt_name": entry.get("debt_name"),
+        "principal_portion": entry.get("principal_portion"),
         "category": entry.get("category"),
         "note": entry.get("note"),
         # balance display helpers
@@ -337,6 +474,69 @@ def get_valid_types(category: str) -> list[str]:
 
     return types
 
+#---------- ledger dedupe ----------
+
+_STRIP_COMMAS = str.maketrans("", "", ",")
+_CENTS_LIMIT = 1 << 32
+
+def to_cents(x) -> int:
+    # parse straight to integer cents; "1,234.565" -> 123457 (half-up)
+    try:
+        d = Decimal(str(x).translate(_STRIP_COMMAS).strip()).scaleb(2)
+        return int(d.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except Exception:
+        return 0
+
+def dedupe_key(ts_iso: str, amount_cents: int) -> int:
+    # we dedupe on DATE (yyyy-mm-dd) and absolute amount in integer cents,
+    # packed into one int: yyyymmdd in the high bits, cents in the low 32
+    cents = abs(amount_cents)
+    if cents >= _CENTS_LIMIT:
+        raise ValueError(f"Amount out of range: {amount_cents!r} cents")
+    yyyymmdd = int(ts_iso[:4]) * 10000 + int(ts_iso[5:7]) * 100 + int(ts_iso[8:10])
+    return (yyyymmdd << 32) | cents
+
+def dedupe_path(pref: str) -> str:
+    return f"{pref}ledger/dedupe.json"
+
+def load_dedupe_keys(store, pref: str, review_index: list[dict]) -> set[int]:
+    """
+    Persisted dedupe keys (ledger + review inbox) so uploads don't have to
+    download and walk the full ledger index. Rebuilt from index.json plus
+    review_index when the file is missing (first upload, or invalidated by
+    a delete).
+    """
+    keys = store.read_json(dedupe_path(pref))
+    if isinstance(keys, list):
+        return set(keys)
+
+    existing: set[int] = set()
+    for rows in (store.read_json(f"{pref}ledger/index.json") or [], review_index or []):
+        for r in rows:
+            try:
+                existing.add(dedupe_key(r.get("ts") or "", to_cents(r.get("amount") or 0)))
+            except Exception:
+                continue
+    return existing
+
+def add_dedupe_key(store, pref: str, ts_iso: str, amount) -> None:
+    # called when an entry lands in the ledger outside of an upload
+    keys = store.read_json(dedupe_path(pref))
+    if not isinstance(keys, list):
+        return  # nothing persisted yet; next upload rebuilds from the indexes
+    try:
+        key = dedupe_key(ts_iso or "", to_cents(amount or 0))
+    except Exception:
+        return
+    if key not in keys:
+        keys.append(key)
+        store.write_json(dedupe_path(pref), keys)
+
+def invalidate_dedupe_keys(store, pref: str) -> None:
+    # removals can't be applied to a plain key set (two entries may share a
+    # key), so drop it and let the next upload rebuild from the indexes
+    store.delete(dedupe_path(pref))
+
 #---------- tenant utils ----------
 
 def tenant_email_key(email: str) -> str:
@@ -346,6 +546,92 @@ def tenant_email_key(email: str) -> str:
 def tenant_directory_path(email: str) -> str:
     return f"rentals/tenant_directory/by_email/{tenant_email_key(email)}.json"
 
+# directory path -> (expires_at, entry); active entries only, see read_tenant_directory
+_TENANT_DIR_TTL = 60
+_tenant_dir_cache = BoundedCache(4096)
+
+def read_tenant_directory(email: str) -> Optional[dict]:
+    """
+    The config-bucket directory entry for a tenant email. Active entries are
+    kept in-process for _TENANT_DIR_TTL seconds, since they only change when
+    the owner adds or removes the tenant (which calls forget_tenant_directory).
+    Misses and inactive entries aren't cached, so a newly added tenant is
+    recognized right away. The entry is shared: read-only callers only.
+    """
+    path = tenant_directory_path(email)
+    now = time.time()
+    hit = _tenant_dir_cache.get(path)
+    if hit and now < hit[0]:
+        return hit[1]
+
+    entry = current_app.config_store.read_json(path)
+    if entry and entry.get("active"):
+        _tenant_dir_cache.set(path, (now + _TENANT_DIR_TTL, entry), stale=lambda v: v[0] <= now)
+    else:
+        _tenant_dir_cache.pop(path, None)
+    return entry
+
+def forget_tenant_directory(email: str) -> None:
+    # this process only; other instances pick the change up within the TTL
+    _tenant_dir_cache.pop(tenant_directory_path(email), None)
+
+def tenant_receipts_path(owner_user_id: str, tenant_id: str) -> str:
+    # per-tenant copy of that tenant's rows from rentals/receipts.json
+    return f"{user_prefix(owner_user_id)}rentals/receipts_by_tenant/{tenant_id}.json"
+
+def receipts_for_tenant(receipts: dict, tenant_id: str) -> dict:
+    return {
+        rid: r for rid, r in (receipts or {}).items()
+        if isinstance(r, dict) and r.get("tenant_id") == tenant_id
+    }
+
+def save_receipts(store, owner_user_id: str, receipts: dict, tenant_id: str) -> None:
+    """
+    Write rentals/receipts.json (the source of truth), then the shard for the
+    tenant whose receipt changed. If the shard write fails the shard is
+    deleted, so readers fall back to receipts.json rather than a stale copy.
+    """
+    store.write_json(f"{user_prefix(owner_user_id)}rentals/receipts.json", receipts)
+    path = tenant_receipts_path(owner_user_id, tenant_id)
+    try:
+        store.write_json(path, receipts_for_tenant(receipts, tenant_id))
+    except Exception:
+        logging.exception("Writing receipt shard %s failed; removing it", path)
+        store.delete(path)
+
+def load_tenant_receipts(store, owner_user_id: str, tenant_id: str, load_all) -> dict:
+    """
+    One tenant's receipts without reading every tenant's receipts. A tenant
+    whose shard doesn't exist yet (receipts saved before shards) is filtered
+    from load_all() instead. Not written back: a shard rebuilt from a read
+    that raced a webhook save would drop the new receipt; see
+    backfill_receipt_shards.
+    """
+    data = store.read_json(tenant_receipts_path(owner_user_id, tenant_id))
+    if isinstance(data, dict):
+        return data
+    return receipts_for_tenant(load_all(), tenant_id)
+
+def backfill_receipt_shards(store, owner_user_id: str) -> list[str]:
+    """
+    One-off migration: write the shard for every tenant in the owner's
+    receipts.json that doesn't have one yet. Run it while no payments are
+    coming in (e.g. from `flask shell`); returns the tenant ids written.
+    """
+    receipts = store.read_json(f"{user_prefix(owner_user_id)}rentals/receipts.json") or {}
+    tenant_ids = sorted({
+        r["tenant_id"] for r in receipts.values()
+        if isinstance(r, dict) and r.get("tenant_id")
+    })
+    paths = [tenant_receipts_path(owner_user_id, tid) for tid in tenant_ids]
+    missing = [
+        (tid, path) for tid, path, shard in zip(tenant_ids, paths, store.read_json_many(paths))
+        if shard is None
+    ]
+    store.write_json_many((path, receipts_for_tenant(receipts, tid)) for tid, path in missing)
+    return [tid for tid, _ in missing]
+
+@lru_cache(maxsize=1024)
 def month_label(ym: str) -> str:
     # ym is "YYYY-MM"
     try:
@@ -365,20 +651,36 @@ def month_range(start_ymd: str, end_ymd: str) -> list[str]:
     e = (end_ymd or "").strip()
     if not s or not e:
         return []
+    return list(_month_span(s, e))
 
-    start = dt.datetime.fromisoformat(s + "T00:00:00").date()
-    end   = dt.datetime.fromisoformat(e + "T00:00:00").date()
+@lru_cache(maxsize=1024)
+def _month_span(start_ymd: str, end_ymd: str) -> tuple[str, ...]:
+    # months as integers (year * 12 + month - 1) → one f-string per month,
+    # no date object per step; leases repeat, so spans are memoized
+    start = dt.datetime.fromisoformat(start_ymd + "T00:00:00").date()
+    end   = dt.datetime.fromisoformat(end_ymd + "T00:00:00").date()
 
-    cur = dt.date(start.year, start.month, 1)
-    endm = dt.date(end.year, end.month, 1)
+    first = start.year * 12 + start.month - 1
+    last  = end.year * 12 + end.month - 1
+    return tuple(f"{v // 12:04d}-{v % 12 + 1:02d}" for v in range(first, last + 1))
 
-    out = []
-    while cur <= endm:
-        out.append(cur.strftime("%Y-%m"))
-        # add one month
-        y, m = cur.year, cur.month
-        cur = dt.date(y + (m // 12), (m % 12) + 1, 1)
-    return out
+def _rank_receipt(r: dict) -> tuple[int, int]:
+    """
+    Higher is better.
+    1) paid-in-full beats partial beats other
+    2) newer updated_at/created_at beats older
+    """
+    status = (r.get("status") or "").strip().lower()
+    if status == "paid in full":
+        s = 3
+    elif "partial" in status:
+        s = 2
+    elif status == "nsf / returned":
+        s = 0
+    else:
+        s = 1
+    ts = int(r.get("updated_at") or r.get("created_at") or 0)
+    return (s, ts)
 
 def build_coverage_grid(tenant: dict, tenant_receipts: dict) -> tuple[list[str], dict, list[dict]]:
     lease = (tenant or {}).get("lease") or {}
@@ -394,26 +696,9 @@ def build_coverage_grid(tenant: dict, tenant_receipts: dict) -> tuple[list[str],
 
     lease_months = month_range(start, end)
 
-    def _rank_receipt(r: dict) -> tuple[int, int]:
-        """
-        Higher is better.
-        1) paid-in-full beats partial beats other
-        2) newer updated_at/created_at beats older
-        """
-        status = (r.get("status") or "").strip().lower()
-        if status == "paid in full":
-            s = 3
-        elif "partial" in status:
-            s = 2
-        elif status == "nsf / returned":
-            s = 0
-        else:
-            s = 1
-        ts = int(r.get("updated_at") or r.get("created_at") or 0)
-        return (s, ts)
-
-    # Pick best receipt per covered_month
-    for _, r in (tenant_receipts or {}).items():
+    # Pick best receipt per covered_month; each receipt is ranked once
+    best: dict[str, tuple[tuple[int, int], dict]] = {}
+    for r in (tenant_receipts or {}).values():
         if not isinstance(r, dict):
             continue
         m = (r.get("covered_month") or "").strip()
@@ -422,21 +707,33 @@ def build_coverage_grid(tenant: dict, tenant_receipts: dict) -> tuple[list[str],
         if (r.get("status") or "").strip() == "NSF / returned":
             continue
 
-        prev = coverage_map.get(m)
-        if prev is None or _rank_receipt(r) > _rank_receipt(prev):
-            coverage_map[m] = r
+        rank = _rank_receipt(r)
+        prev = best.get(m)
+        if prev is None or rank > prev[0]:
+            best[m] = (rank, r)
+    coverage_map = {m: r for m, (_, r) in best.items()}
 
-    for ym in lease_months:
-        r = coverage_map.get(ym)
-        covered = bool(r)  # covered means there is *some* receipt (partial or full)
-        coverage_grid.append({
+    # covered means there is *some* receipt (partial or full); "paid" keeps
+    # the existing template behavior
+    coverage_grid = [
+        {
+            "ym": ym,
+            "label": month_label(ym),
+            "paid": True,
+            "status": r.get("status"),
+            "receipt_id": r.get("receipt_id"),
+            "date_paid": r.get("date_paid"),
+            "amount": r.get("amount"),
+        } if r else {
             "ym": ym,
             "label": month_label(ym),
-            "paid": covered,  # keep your existing template behavior
-            "status": (r.get("status") if r else "Not paid"),
-            "receipt_id": (r.get("receipt_id") if r else None),
-            "date_paid": (r.get("date_paid") if r else None),
-            "amount": (r.get("amount") if r else None),
-        })
+            "paid": False,
+            "status": "Not paid",
+            "receipt_id": None,
+            "date_paid": None,
+            "amount": None,
+        }
+        for ym, r in ((ym, coverage_map.get(ym)) for ym in lease_months)
+    ]
 
     return lease_months, coverage_map, coverage_grid